@@ -1,18 +1,123 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, g
+import io
+import time
+import hashlib
+import secrets
+from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
-import joblib
 from functools import wraps
-from database import Database
+from database import Database, TREND_GRANULARITIES, TREND_GROUPS
+from inference import RISK_LABELS
+from model_registry import ModelRegistry
+from export import iter_export, FORMATS as EXPORT_FORMATS
+from sessions import SqliteSessionInterface
+from auth import Authenticator, LoginThrottled, LoginBusy
+from write_behind import PredictionWriter
+from metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Histogram
+from config import get_config
+from cache import LRUCache
+
+# Deployment settings (config file + HRP_* environment), validated before anything starts
+config = get_config()
 
 app = Flask(__name__)
-app.secret_key = 'your-secret-key-change-this-in-production'  # Change this in production!
+app.secret_key = config.secret_key
 
 # Initialize database
-db = Database()
+db = Database(config=config)
+
+# Sessions live server-side in the database; the cookie only holds a random id
+app.session_interface = SqliteSessionInterface(db)
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=config.session_lifetime_hours)
+
+# Password checks run on a small bounded pool so login bursts cannot starve other routes
+authenticator = Authenticator(db, workers=config.login_workers, max_pending=config.login_max_pending)
+
+# Optional write-behind persistence for /predict (HRP_WRITE_BEHIND=1): rows are journaled,
+# queued and committed in batches by a background thread instead of on the request path
+prediction_writer = None
+
+def start_prediction_writer():
+    """Start this process's write-behind writer if enabled; it journals to <journal>.<pid>"""
+    global prediction_writer
+    if not config.write_behind:
+        return None
+    prediction_writer = PredictionWriter(
+        db,
+        config.prediction_journal,
+        flush_interval=config.write_behind_interval,
+        max_batch=config.write_behind_batch,
+        fsync=config.write_behind_fsync
+    )
+    return prediction_writer
+
+def stop_prediction_writer():
+    """Commit pending write-behind rows and stop the writer thread"""
+    global prediction_writer
+    if prediction_writer is not None:
+        prediction_writer.close()
+        prediction_writer = None
+
+start_prediction_writer()
+
+# Load ML models once at startup; new versions are picked up without a restart
+model_registry = ModelRegistry(
+    root=config.model_dir,
+    legacy_dir=config.legacy_model_dir,
+    check_interval=config.model_check_interval,
+    cache_size=config.prediction_cache_size
+)
+model_registry.current()
+
+# Batch scoring accepts either form field names or the healthcare_dataset.csv headers
+BATCH_COLUMNS = {
+    'Name': 'patient_name',
+    'Age': 'age',
+    'Gender': 'gender',
+    'Blood Type': 'blood_type',
+    'Medical Condition': 'medical_condition',
+    'Admission Type': 'admission_type',
+    'Medication': 'medication',
+    'Insurance Provider': 'insurance_provider',
+    'Room Number': 'room_number',
+    'Billing Amount': 'billing_amount'
+}
+PATIENT_FIELDS = list(BATCH_COLUMNS.values())
+MAX_BATCH_ROWS = config.max_batch_rows
 
-# Load ML models
-pca_model = joblib.load("pca_model.pkl")
-kmeans_model = joblib.load("kmeans_model.pkl")
+# Request metrics, exposed on /metrics
+HTTP_REQUESTS = Counter('hrp_http_requests_total', 'HTTP requests served', ['endpoint', 'method', 'status'])
+HTTP_LATENCY = Histogram('hrp_http_request_seconds', 'Time from routing to response', ['endpoint', 'method'])
+PREDICT_PHASE = Histogram('hrp_predict_phase_seconds', 'Time spent in each step of the prediction routes',
+                          ['route', 'phase'])
+PREDICTIONS = Counter('hrp_predictions_total', 'Patients scored', ['route', 'risk_level'])
+PAGE_CACHE = Counter('hrp_page_cache_total', 'Cacheable page requests by outcome', ['endpoint', 'outcome'])
+
+# Rendered /dashboard and /history pages, keyed by viewer, URL and data version
+page_cache = LRUCache(config.page_cache_size, config.page_cache_ttl)
+# Shared by forked workers; changes on restart, so a deploy never answers 304 with old markup
+PAGE_CACHE_SALT = secrets.token_hex(8)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Unmatched URLs share one label so 404 scans cannot grow the series set
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+@app.teardown_request
+def record_failed_request(exc):
+    # after_request is skipped when a view raises; count those as 500s
+    if exc is not None and g.pop('request_started', None) is not None:
+        HTTP_REQUESTS.labels(request.endpoint or 'unmatched', request.method, 500).inc()
 
 # Role-based access decorator
 def login_required(f):
@@ -31,7 +136,13 @@ def role_required(*roles):
             if 'user_id' not in session:
                 flash('Please login to access this page', 'warning')
                 return redirect(url_for('login'))
-            if session.get('role') not in roles:
+            # Role comes from the (cached) user record, not whatever the session last stored
+            user = db.get_user_by_id(session['user_id'])
+            if user is None:
+                session.clear()
+                flash('Please login to access this page', 'warning')
+                return redirect(url_for('login'))
+            if user['role'] not in roles:
                 flash('You do not have permission to access this page', 'danger')
                 return redirect(url_for('dashboard'))
             return f(*args, **kwargs)
@@ -53,8 +164,22 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        success, user = db.verify_user(username, password)
-        if success:
+        try:
+            user = authenticator.authenticate(username, password, request.remote_addr)
+        except LoginThrottled as e:
+            flash(str(e), 'danger')
+            response = app.make_response((render_template('login.html'), 429))
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        except LoginBusy as e:
+            flash(str(e), 'warning')
+            response = app.make_response((render_template('login.html'), 503))
+            response.headers['Retry-After'] = '5'
+            return response
+        
+        if user:
+            # New session id on login so a pre-login id cannot be reused
+            session.regenerate()
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['role'] = user['role']
@@ -98,23 +223,67 @@ def logout():
     flash('You have been logged out', 'info')
     return redirect(url_for('login'))
 
+def cached_page(template, data_user_id, build_context):
+    """Render a page built from predictions, answering repeat views cheaply.
+    
+    data_user_id is whose predictions the page shows (None: everyone's). While
+    their data version is unchanged the page keeps its ETag, so conditional
+    requests get a 304 without touching the data, and other requests reuse the
+    rendered HTML. Pages with pending flash messages are always rendered.
+    """
+    if '_flashes' in session:
+        PAGE_CACHE.labels(request.endpoint, 'bypass').inc()
+        return render_template(template, **build_context())
+    
+    version, updated_at = db.get_data_version(data_user_id)
+    # The navbar shows the viewer, so they are part of the key as well
+    key = (PAGE_CACHE_SALT, request.full_path, session.get('user_id'), session.get('role'),
+           session.get('full_name'), version)
+    response = app.response_class(mimetype='text/html')
+    response.set_etag(hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest())
+    if updated_at:
+        response.last_modified = datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    # Browsers must revalidate every time, and shared caches must not store per-user pages
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    response.make_conditional(request)
+    if response.status_code == 304:
+        PAGE_CACHE.labels(request.endpoint, 'not_modified').inc()
+        return response
+    
+    html = page_cache.get(key)
+    PAGE_CACHE.labels(request.endpoint, 'miss' if html is None else 'hit').inc()
+    if html is None:
+        html = render_template(template, **build_context())
+        page_cache.set(key, html)
+    response.set_data(html)
+    return response
+
 @app.route('/dashboard')
 @login_required
 def dashboard():
     role = session.get('role')
-    user_id = session.get('user_id')
-    
-    # Get statistics
-    if role == 'Doctor':
-        stats = db.get_statistics()  # Doctors see all stats
-        recent_predictions = db.get_predictions(limit=10)
-    else:
-        stats = db.get_statistics(user_id)  # Others see only their stats
-        recent_predictions = db.get_predictions(user_id, limit=10)
+    # Doctors see all stats, others only their own
+    user_id = None if role == 'Doctor' else session.get('user_id')
     
-    return render_template(f'dashboard_{role.lower()}.html', 
-                         stats=stats, 
-                         recent_predictions=recent_predictions)
+    def build_context():
+        return {
+            'stats': db.get_statistics(user_id),
+            'recent_predictions': db.get_predictions(user_id, limit=10)
+        }
+    return cached_page(f'dashboard_{role.lower()}.html', user_id, build_context)
+
+def form_number(name):
+    """A finite number from the submitted form, else ValueError naming the field"""
+    label = name.replace('_', ' ').title()
+    try:
+        value = float(request.form[name])
+    except ValueError:
+        raise ValueError(f'{label} must be a number')
+    if not np.isfinite(value):
+        raise ValueError(f'{label} must be a finite number')
+    return value
 
 @app.route('/predict', methods=['GET', 'POST'])
 @login_required
@@ -122,57 +291,270 @@ def predict():
     result = None
     
     if request.method == 'POST':
-        # Collect patient data
-        patient_data = {
-            'patient_name': request.form.get('patient_name', 'Unknown'),
-            'age': float(request.form['age']),
-            'room_number': float(request.form['room_number']),
-            'billing_amount': float(request.form['billing_amount']),
-            'gender': request.form.get('gender'),
-            'blood_type': request.form.get('blood_type'),
-            'medical_condition': request.form.get('medical_condition'),
-            'admission_type': request.form.get('admission_type'),
-            'medication': request.form.get('medication'),
-            'insurance_provider': request.form.get('insurance_provider')
-        }
-        
-        # Prepare data for ML model (only numerical features)
-        input_data = pd.DataFrame([{
-            "Age": patient_data['age'],
-            "Billing Amount": patient_data['billing_amount'],
-            "Room Number": patient_data['room_number']
-        }])
-        
-        # PCA transformation
-        pca_features = pca_model.transform(input_data)
-        
-        # KMeans prediction
-        cluster = kmeans_model.predict(pca_features)[0]
-        
-        # Map cluster to risk label
-        risk_map = {0: "Low Risk", 1: "Medium Risk", 2: "High Risk"}
-        result = risk_map.get(cluster, "Unknown")
-        
-        # Save prediction to database
-        db.save_prediction(session['user_id'], patient_data, result)
-        
-        flash(f'Prediction completed: {result}', 'success')
+        try:
+            # Collect patient data
+            with PREDICT_PHASE.time('predict', 'parse'):
+                patient_data = {
+                    'patient_name': request.form.get('patient_name', 'Unknown'),
+                    'age': form_number('age'),
+                    'room_number': form_number('room_number'),
+                    'billing_amount': form_number('billing_amount'),
+                    'gender': request.form.get('gender'),
+                    'blood_type': request.form.get('blood_type'),
+                    'medical_condition': request.form.get('medical_condition'),
+                    'admission_type': request.form.get('admission_type'),
+                    'medication': request.form.get('medication'),
+                    'insurance_provider': request.form.get('insurance_provider')
+                }
+            
+            # Score with the NumPy engine (same math as the PCA/KMeans models, no DataFrame);
+            # repeat inputs are answered from the registry's per-version cache
+            with PREDICT_PHASE.time('predict', 'score'):
+                result, model_version = model_registry.predict_one(
+                    patient_data['age'],
+                    patient_data['billing_amount'],
+                    patient_data['room_number']
+                )
+        except ValueError as e:
+            flash(str(e), 'danger')
+        else:
+            PREDICTIONS.labels('predict', result).inc()
+            
+            # Save prediction to database (or hand it to the write-behind queue)
+            with PREDICT_PHASE.time('predict', 'save'):
+                saved = (prediction_writer or db).save_prediction(session['user_id'], patient_data, result,
+                                                                  model_version)
+            
+            if saved:
+                flash(f'Prediction completed: {result}', 'success')
+            else:
+                flash(f'Prediction {result} could not be saved, please try again', 'danger')
     
-    return render_template('predict.html', result=result)
+    with PREDICT_PHASE.time('predict', 'render'):
+        return render_template('predict.html', result=result)
+
+def score_patients(frame, models):
+    """Score a DataFrame of patients with one PCA/KMeans pass, returning risk labels"""
+    return models.engine.predict_many(
+        frame['age'].to_numpy(dtype=float),
+        frame['billing_amount'].to_numpy(dtype=float),
+        frame['room_number'].to_numpy(dtype=float)
+    )
+
+def load_batch_frame():
+    """Read a batch of patients from an uploaded CSV or a JSON array"""
+    upload = request.files.get('file')
+    if upload and upload.filename:
+        frame = pd.read_csv(upload)
+    elif request.is_json:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get('patients')
+        if not isinstance(payload, list):
+            raise ValueError('Expected a JSON array of patients')
+        if not all(isinstance(patient, dict) for patient in payload):
+            raise ValueError('Expected every patient to be a JSON object')
+        frame = pd.DataFrame.from_records(payload)
+    else:
+        raise ValueError('Upload a CSV file or POST a JSON array of patients')
+    
+    # "Age" and "age" both become age; reindex would fail on the duplicate label
+    sources = {}
+    for column in frame.columns:
+        sources.setdefault(BATCH_COLUMNS.get(column, column), []).append(str(column))
+    conflicts = [f'{" and ".join(columns)} ({field})' for field, columns in sources.items() if len(columns) > 1]
+    if conflicts:
+        raise ValueError(f'Columns map to the same field: {"; ".join(conflicts)}')
+    frame = frame.rename(columns=BATCH_COLUMNS)
+    missing = [c for c in ('age', 'room_number', 'billing_amount') if c not in frame.columns]
+    if missing:
+        raise ValueError(f'Missing required columns: {", ".join(missing)}')
+    if len(frame) > MAX_BATCH_ROWS:
+        raise ValueError(f'Batch too large: {len(frame)} rows (max {MAX_BATCH_ROWS})')
+    
+    frame = frame.reindex(columns=PATIENT_FIELDS)
+    for column in ('age', 'room_number', 'billing_amount'):
+        try:
+            frame[column] = pd.to_numeric(frame[column], errors='raise')
+        except TypeError:
+            # JSON arrays or objects as values
+            raise ValueError('Age, Room Number and Billing Amount must be numbers')
+    if frame[['age', 'room_number', 'billing_amount']].isna().any().any():
+        raise ValueError('Age, Room Number and Billing Amount are required on every row')
+    if not np.isfinite(frame[['age', 'room_number', 'billing_amount']].to_numpy(dtype=float)).all():
+        raise ValueError('Age, Room Number and Billing Amount must be finite numbers')
+    return frame
+
+@app.route('/predict/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    try:
+        with PREDICT_PHASE.time('predict_batch', 'parse'):
+            frame = load_batch_frame()
+    except (ValueError, pd.errors.ParserError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        with PREDICT_PHASE.time('predict_batch', 'score'):
+            models = model_registry.current()
+            risk_levels = score_patients(frame, models)
+    except ValueError as e:
+        # Values too large to score
+        return jsonify({'error': str(e)}), 400
+    
+    summary = {label: int((risk_levels == label).sum()) for label in RISK_LABELS}
+    for label, count in summary.items():
+        if count:
+            PREDICTIONS.labels('predict_batch', label).inc(count)
+    
+    # Save every row in one transaction
+    with PREDICT_PHASE.time('predict_batch', 'save'):
+        patients = frame.astype(object).where(frame.notna(), None).to_dict('records')
+        saved = db.save_predictions(session['user_id'], patients, risk_levels.tolist(), models.version)
+    
+    results = pd.DataFrame({
+        'row': np.arange(len(frame)),
+        'patient_name': frame['patient_name'].fillna('Unknown'),
+        'risk_level': risk_levels
+    })
+    
+    if request.values.get('format') == 'csv':
+        buffer = io.StringIO()
+        results.to_csv(buffer, index=False)
+        return Response(buffer.getvalue(), mimetype='text/csv', headers={
+            'Content-Disposition': 'attachment; filename=risk_predictions.csv'
+        })
+    
+    return jsonify({
+        'count': len(results),
+        'saved': saved,
+        'model_version': models.version,
+        'summary': summary,
+        'results': results.to_dict('records')
+    })
+
+HISTORY_PAGE_SIZE = config.history_page_size
+HISTORY_FILTERS = ('risk_level', 'medical_condition', 'date_from', 'date_to')
+
+def history_filters(args):
+    """Validated /history filter values from the query string"""
+    filters = {}
+    for name in HISTORY_FILTERS:
+        value = args.get(name, '').strip()
+        if not value:
+            continue
+        if name.startswith('date_'):
+            try:
+                value = datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+        filters[name] = value
+    return filters
 
 @app.route('/history')
 @login_required
 def history():
-    user_id = session.get('user_id')
-    role = session.get('role')
-    
     # Doctors can see all predictions, others see only their own
-    if role == 'Doctor':
-        predictions = db.get_predictions(limit=100)
-    else:
-        predictions = db.get_predictions(user_id, limit=100)
+    user_id = None if session.get('role') == 'Doctor' else session.get('user_id')
+    filters = history_filters(request.args)
     
-    return render_template('history.html', predictions=predictions)
+    def build_context():
+        page = db.get_prediction_page(
+            user_id,
+            page_size=HISTORY_PAGE_SIZE,
+            cursor=request.args.get('cursor'),
+            direction=request.args.get('direction', 'next'),
+            **filters
+        )
+        return {
+            'predictions': page['predictions'],
+            'next_cursor': page['next_cursor'],
+            'prev_cursor': page['prev_cursor'],
+            'filters': filters,
+            'risk_levels': RISK_LABELS
+        }
+    return cached_page('history.html', user_id, build_context)
+
+@app.route('/export')
+@login_required
+def export_predictions():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {fmt}'}), 400
+    
+    # Same visibility rule as /history
+    user_id = None if session.get('role') == 'Doctor' else session.get('user_id')
+    batches = db.iter_prediction_batches(user_id, **history_filters(request.args))
+    try:
+        chunks = iter_export(batches, fmt)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 501
+    
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"predictions_{datetime.now():%Y%m%d_%H%M%S}.{extension}"
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+SEARCH_PAGE_SIZE = config.search_page_size
+
+@app.route('/search')
+@login_required
+def search():
+    """Ranked patient search over prediction history (HTML, or JSON with format=json)"""
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    
+    # Same visibility rule as /history
+    user_id = None if session.get('role') == 'Doctor' else session.get('user_id')
+    results = db.search_predictions(query, user_id=user_id, page=page, page_size=SEARCH_PAGE_SIZE)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({'query': query, **results})
+    return render_template('search.html', query=query, **results)
+
+# Default look-back per trend granularity, in days
+TREND_DEFAULT_DAYS = {'hour': 2, 'day': 90, 'week': 365}
+
+@app.route('/api/trends')
+@login_required
+def api_trends():
+    """Risk counts over time, served from the hourly/daily rollup tables"""
+    granularity = request.args.get('granularity', 'day')
+    group_by = request.args.get('group_by') or None
+    if granularity not in TREND_GRANULARITIES:
+        return jsonify({'error': f'Unknown granularity: {granularity}'}), 400
+    if group_by is not None and group_by not in TREND_GROUPS:
+        return jsonify({'error': f'Unknown group_by: {group_by}'}), 400
+    
+    filters = history_filters(request.args)
+    date_from = filters.get('date_from') or (
+        datetime.now() - timedelta(days=TREND_DEFAULT_DAYS[granularity])).strftime('%Y-%m-%d')
+    
+    # Same visibility rule as /history: doctors see everyone (or pick a user), others themselves
+    if session.get('role') == 'Doctor':
+        user_id = request.args.get('user_id', type=int)
+    else:
+        user_id = session.get('user_id')
+    try:
+        buckets = db.get_risk_trends(
+            granularity,
+            group_by,
+            user_id=user_id,
+            date_from=date_from,
+            date_to=filters.get('date_to'),
+            medical_condition=filters.get('medical_condition'),
+            admission_type=request.args.get('admission_type') or None
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'granularity': granularity,
+        'group_by': group_by,
+        'date_from': date_from,
+        'date_to': filters.get('date_to'),
+        'buckets': buckets
+    })
 
 @app.route('/users')
 @role_required('Doctor')
@@ -180,5 +562,37 @@ def users():
     all_users = db.get_all_users()
     return render_template('users.html', users=all_users)
 
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: the database answers and a model version is loaded"""
+    checks = {}
+    try:
+        with db.connection() as conn:
+            conn.execute('SELECT 1')
+        checks['database'] = 'ok'
+    except Exception as e:
+        checks['database'] = str(e)
+    try:
+        checks['model_version'] = model_registry.current().version
+    except Exception as e:
+        checks['model_version'] = None
+        checks['model_error'] = str(e)
+    ready = checks['database'] == 'ok' and checks['model_version'] is not None
+    return jsonify({'ready': ready, 'checks': checks}), 200 if ready else 503
+
+# Set by serve.py when it forks workers, so /metrics covers all of them
+metrics_snapshots = None
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus scrape endpoint (aggregate counts and latencies only)"""
+    body = metrics_snapshots.render() if metrics_snapshots is not None else REGISTRY.render()
+    return Response(body, content_type=METRICS_CONTENT_TYPE)
+
 if __name__ == "__main__":
     app.run(debug=True)
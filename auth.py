@@ -0,0 +1,154 @@
+"""
+Throttled, bounded-cost password verification for /login
+Password hashing deliberately costs tens of milliseconds of CPU. Running it
+on a small fixed pool with a cap on waiting requests means a login storm
+queues (or is turned away) instead of occupying every request thread, so
+/predict and /dashboard keep their latency.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from database import PASSWORD_HASH_METHOD
+from metrics import Counter, Histogram
+
+LOGIN_ATTEMPTS = Counter('hrp_login_attempts_total', 'Login attempts by outcome', ['outcome'])
+PASSWORD_CHECK_SECONDS = Histogram('hrp_password_check_seconds', 'Time to verify (and rehash) a password')
+
+# Verified against when the username does not exist, so unknown and known
+# usernames take the same time to reject
+_DUMMY_HASH = generate_password_hash('not-a-real-password', method=PASSWORD_HASH_METHOD)
+
+
+class LoginThrottled(Exception):
+    """Too many recent failures for this username or address"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'Too many login attempts; retry in {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+class LoginBusy(Exception):
+    """The verification queue is full"""
+
+
+def hash_method(password_hash):
+    """Method prefix of a werkzeug hash, e.g. 'pbkdf2:sha256:600000'"""
+    return password_hash.split('$', 1)[0]
+
+
+class LoginThrottle:
+    """Sliding-window failure counter per key (username or client address)"""
+
+    def __init__(self, max_failures, window):
+        self.max_failures = max_failures
+        self.window = window
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, failures, now):
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+
+    def retry_after(self, key):
+        """Seconds until `key` may try again, 0 if it is not throttled"""
+        now = time.monotonic()
+        with self._lock:
+            failures = self._failures.get(key)
+            if not failures:
+                return 0
+            self._prune(failures, now)
+            if len(failures) < self.max_failures:
+                return 0
+            return max(1, int(failures[0] + self.window - now) + 1)
+
+    def record_failure(self, key):
+        now = time.monotonic()
+        with self._lock:
+            failures = self._failures.setdefault(key, deque())
+            failures.append(now)
+            self._prune(failures, now)
+            if len(self._failures) > 10000:
+                # Forget keys whose failures have all aged out
+                for stale in [k for k, v in self._failures.items() if not v or v[-1] <= now - self.window]:
+                    del self._failures[stale]
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+class Authenticator:
+    """Verifies logins on a bounded worker pool with throttling and rehashing"""
+
+    def __init__(self, db, workers=2, max_pending=16, timeout=10.0,
+                 username_limit=(5, 900), address_limit=(30, 900), method=PASSWORD_HASH_METHOD):
+        self.db = db
+        self.timeout = timeout
+        self.method = method
+        self.by_username = LoginThrottle(*username_limit)
+        self.by_address = LoginThrottle(*address_limit)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-check')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _check(self, password_hash, password):
+        """Runs on the pool: verify, and produce an upgraded hash if the stored one is outdated"""
+        with PASSWORD_CHECK_SECONDS.time():
+            if not check_password_hash(password_hash, password):
+                return False, None
+            if hash_method(password_hash) != self.method:
+                return True, generate_password_hash(password, method=self.method)
+            return True, None
+
+    def _run(self, password_hash, password):
+        if not self._slots.acquire(blocking=False):
+            LOGIN_ATTEMPTS.labels('busy').inc()
+            raise LoginBusy('Login service is busy, please try again shortly')
+        try:
+            future = self._executor.submit(self._check, password_hash, password)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot stays taken until the hash finishes, even if we stop waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            LOGIN_ATTEMPTS.labels('busy').inc()
+            raise LoginBusy('Login service is busy, please try again shortly')
+
+    def authenticate(self, username, password, address=None):
+        """The user record for valid credentials, otherwise None.
+
+        Raises LoginThrottled or LoginBusy instead of doing the work when
+        the caller is over its attempt limit or the queue is full.
+        """
+        username_key = username.strip().lower()
+        retry_after = max(self.by_username.retry_after(username_key),
+                          self.by_address.retry_after(address) if address else 0)
+        if retry_after:
+            LOGIN_ATTEMPTS.labels('throttled').inc()
+            raise LoginThrottled(retry_after)
+
+        user = self.db.get_user_by_username(username)
+        ok, new_hash = self._run(user['password_hash'] if user else _DUMMY_HASH, password)
+        if not (user and ok):
+            self.by_username.record_failure(username_key)
+            if address:
+                self.by_address.record_failure(address)
+            LOGIN_ATTEMPTS.labels('failure').inc()
+            return None
+
+        self.by_username.reset(username_key)
+        if new_hash:
+            self.db.update_password_hash(user['id'], new_hash)
+            LOGIN_ATTEMPTS.labels('rehashed').inc()
+        LOGIN_ATTEMPTS.labels('success').inc()
+        return user
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
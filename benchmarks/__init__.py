@@ -0,0 +1 @@
+"""Performance benchmarks for the Healthcare Risk Prediction System"""
@@ -0,0 +1,225 @@
+"""
+End-to-end benchmark: Flask routes and Database methods against a seeded temp database
+
+Usage (from the project root):
+    python -m benchmarks.bench_app [--rows 100000] [--iterations 200] [--output results.json]
+    python -m benchmarks.bench_app --compare baseline.json [--tolerance 0.25]
+
+Seeds a temporary SQLite file with seed_data's bulk generator, drives the
+app through Flask's test client, and prints latency/throughput as JSON.
+With --compare, p50 latencies are checked against an earlier run and the
+exit status is 1 if any benchmark regressed by more than the tolerance.
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import warnings
+from dataclasses import replace
+from datetime import datetime
+
+import numpy as np
+
+import seed_data
+from config import get_config, set_config
+from database import Database, PREDICTION_COLUMNS
+
+ROLE_USERS = {
+    'Doctor': 'bulkdr1',
+    'Nurse': 'bulknurse1',
+    'Receptionist': 'bulkreception1'
+}
+
+SAMPLE_PATIENT = {
+    'patient_name': 'Benchmark Patient',
+    'age': '64',
+    'room_number': '312',
+    'billing_amount': '27450.50',
+    'gender': 'Female',
+    'blood_type': 'O+',
+    'medical_condition': 'Diabetes',
+    'admission_type': 'Emergency',
+    'medication': 'Lipitor',
+    'insurance_provider': 'Medicare'
+}
+
+
+def distinct_patients(count, seed_value):
+    """/predict form payloads for `count` different patients from seed_data's generator"""
+    rng = np.random.default_rng(seed_value)
+    rows = seed_data.generate_prediction_batch(rng, count, np.array([0]), datetime.now())
+    return [{name: str(value) for name, value in zip(PREDICTION_COLUMNS, row) if name in SAMPLE_PATIENT}
+            for row in rows]
+
+
+def measure(fn, iterations, warmup=5):
+    """Run fn repeatedly; latency percentiles in ms and calls per second"""
+    for _ in range(warmup):
+        fn()
+    timings = np.empty(iterations)
+    started = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+    elapsed = time.perf_counter() - started
+    timings *= 1000
+    return {
+        'iterations': iterations,
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+        'mean_ms': round(float(timings.mean()), 3),
+        'ops_per_sec': round(iterations / elapsed, 1)
+    }
+
+
+def seed(path, rows, seed_value):
+    """Create and bulk-seed a database file, returning the Database"""
+    db = Database(path)
+    seed_data.db = db
+    # Keep stdout clean for the JSON results
+    with contextlib.redirect_stdout(sys.stderr):
+        seed_data.bulk_seed(rows, seed=seed_value)
+    return db
+
+
+def logged_in_client(flask_app, role):
+    client = flask_app.test_client()
+    response = client.post('/login', data={'username': ROLE_USERS[role], 'password': seed_data.SEED_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'Login as {role} failed')
+    return client
+
+
+def expect_ok(response):
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+
+
+def bench_routes(flask_app, iterations, seed_value):
+    results = {}
+
+    def login():
+        client = flask_app.test_client()
+        client.post('/login', data={'username': ROLE_USERS['Nurse'], 'password': seed_data.SEED_PASSWORD})
+    # Password hashing dominates; fewer iterations keep the run short
+    results['route.login'] = measure(login, max(iterations // 10, 10), warmup=1)
+
+    nurse = logged_in_client(flask_app, 'Nurse')
+    # A new patient every call, so this scores through the engine instead of hitting the
+    # per-version prediction cache; route.predict.cached repeats one patient
+    patients = itertools.cycle(distinct_patients(iterations + 5, seed_value))
+    results['route.predict'] = measure(lambda: expect_ok(nurse.post('/predict', data=next(patients))), iterations)
+    results['route.predict.cached'] = measure(
+        lambda: expect_ok(nurse.post('/predict', data=SAMPLE_PATIENT)), iterations)
+
+    for role in ROLE_USERS:
+        client = logged_in_client(flask_app, role)
+        results[f'route.dashboard.{role.lower()}'] = measure(lambda: expect_ok(client.get('/dashboard')), iterations)
+
+    doctor = logged_in_client(flask_app, 'Doctor')
+    results['route.history.doctor'] = measure(lambda: expect_ok(doctor.get('/history')), iterations)
+    results['route.history.nurse'] = measure(lambda: expect_ok(nurse.get('/history')), iterations)
+    return results
+
+
+def bench_database(db, iterations):
+    results = {}
+    user_id = db.get_all_users()[0]['id']
+    patient = dict(SAMPLE_PATIENT, age=64, room_number=312, billing_amount=27450.50)
+
+    results['db.save_prediction'] = measure(
+        lambda: db.save_prediction(user_id, patient, 'High Risk'), iterations)
+    results['db.get_predictions'] = measure(lambda: db.get_predictions(limit=10), iterations)
+    results['db.get_predictions.user'] = measure(lambda: db.get_predictions(user_id, limit=10), iterations)
+    results['db.get_statistics'] = measure(lambda: db.get_statistics(), iterations)
+    results['db.get_statistics.user'] = measure(lambda: db.get_statistics(user_id), iterations)
+    return results
+
+
+def compare(current, baseline, tolerance):
+    """Print p50 deltas against a previous run; returns the names that regressed"""
+    regressions = []
+    print(f"{'benchmark':<32}{'baseline':>12}{'current':>12}{'change':>10}", file=sys.stderr)
+    for name, result in current['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            continue
+        change = result['p50_ms'] / previous['p50_ms'] - 1 if previous['p50_ms'] else 0.0
+        flag = '  REGRESSION' if change > tolerance else ''
+        print(f"{name:<32}{previous['p50_ms']:>12.3f}{result['p50_ms']:>12.3f}{change:>+10.1%}{flag}",
+              file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='Predictions to seed')
+    parser.add_argument('--iterations', type=int, default=200, help='Calls per benchmark')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='Earlier results JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p50 slowdown (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore', category=UserWarning)
+    workdir = tempfile.mkdtemp(prefix='hrp-bench-')
+    try:
+        # The app (imported below) opens whatever db_path the config names
+        db_path = os.path.join(workdir, 'bench.db')
+        set_config(replace(get_config(), db_path=db_path))
+        started = time.perf_counter()
+        db = seed(db_path, args.rows, args.seed)
+        seed_seconds = time.perf_counter() - started
+
+        import app as app_module
+
+        benchmarks = {}
+        benchmarks.update(bench_routes(app_module.app, args.iterations, args.seed))
+        benchmarks.update(bench_database(db, args.iterations))
+        db.close()
+        app_module.db.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'rows': args.rows,
+            'iterations': args.iterations,
+            'seed_seconds': round(seed_seconds, 2),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform()
+        },
+        'benchmarks': benchmarks
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
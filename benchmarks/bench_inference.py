@@ -0,0 +1,123 @@
+"""
+Micro-benchmark: single-patient inference through sklearn vs the NumPy RiskEngine
+
+Usage (from the project root):
+    python -m benchmarks.bench_inference [--iterations 20000] [--json]
+"""
+
+import argparse
+import json
+import time
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from inference import RiskEngine, RISK_LABELS, MODEL_FEATURES
+
+
+def sklearn_predict(pca_model, kmeans_model, age, billing_amount, room_number):
+    """The original /predict path: one-row DataFrame -> transform -> predict"""
+    input_data = pd.DataFrame([{
+        "Age": age,
+        "Billing Amount": billing_amount,
+        "Room Number": room_number
+    }])
+    pca_features = pca_model.transform(input_data)
+    cluster = kmeans_model.predict(pca_features)[0]
+    return RISK_LABELS[cluster]
+
+
+def sample_inputs(n, seed=42):
+    """Random patients spanning the ranges accepted by the prediction form"""
+    rng = np.random.default_rng(seed)
+    return (
+        rng.integers(0, 121, n).astype(float),
+        np.round(rng.uniform(0, 60000, n), 2),
+        rng.integers(100, 501, n).astype(float)
+    )
+
+
+def time_calls(fn, inputs):
+    """Latency of each call in microseconds"""
+    timings = np.empty(len(inputs[0]))
+    for i, (age, billing, room) in enumerate(zip(*inputs)):
+        start = time.perf_counter()
+        fn(age, billing, room)
+        timings[i] = time.perf_counter() - start
+    return timings * 1e6
+
+
+def summarize(timings):
+    return {
+        'p50_us': round(float(np.percentile(timings, 50)), 2),
+        'p99_us': round(float(np.percentile(timings, 99)), 2),
+        'mean_us': round(float(timings.mean()), 2)
+    }
+
+
+def check_agreement(pca_model, kmeans_model, engine, n):
+    """Compare engine cluster ids with sklearn over a large random batch"""
+    # Form-range inputs plus points around the centroids so every cluster boundary is exercised
+    form_age, form_billing, form_room = sample_inputs(n // 2, seed=7)
+    near = np.random.default_rng(11).normal(0, 2, size=(n - n // 2, 3))
+    age = np.concatenate([form_age, near[:, 0]])
+    billing = np.concatenate([form_billing, near[:, 1]])
+    room = np.concatenate([form_room, near[:, 2]])
+    frame = pd.DataFrame({"Age": age, "Billing Amount": billing, "Room Number": room},
+                         columns=MODEL_FEATURES)
+    expected = kmeans_model.predict(pca_model.transform(frame))
+    batched = engine.predict_clusters(age, billing, room)
+    single = np.array([engine.predict_cluster(a, b, r) for a, b, r in zip(age, billing, room)])
+    return int((expected != batched).sum()), int((expected != single).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--agreement-rows', type=int, default=1000000)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    # Models are fitted on a DataFrame; the KMeans stage warns on ndarray input
+    warnings.filterwarnings('ignore', category=UserWarning)
+
+    pca_model = joblib.load("pca_model.pkl")
+    kmeans_model = joblib.load("kmeans_model.pkl")
+    engine = RiskEngine(pca_model, kmeans_model)
+
+    inputs = sample_inputs(args.iterations)
+    sklearn_timings = time_calls(
+        lambda a, b, r: sklearn_predict(pca_model, kmeans_model, a, b, r), inputs)
+    engine_timings = time_calls(engine.predict_one, inputs)
+    batch_mismatches, single_mismatches = check_agreement(
+        pca_model, kmeans_model, engine, args.agreement_rows)
+
+    results = {
+        'iterations': args.iterations,
+        'sklearn': summarize(sklearn_timings),
+        'numpy_engine': summarize(engine_timings),
+        'speedup_p50': round(float(np.percentile(sklearn_timings, 50) / np.percentile(engine_timings, 50)), 1),
+        'speedup_p99': round(float(np.percentile(sklearn_timings, 99) / np.percentile(engine_timings, 99)), 1),
+        'agreement_rows': args.agreement_rows,
+        'batch_mismatches': batch_mismatches,
+        'single_mismatches': single_mismatches
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Single-patient inference, {args.iterations} calls")
+    print(f"  {'path':<14}{'p50 (us)':>12}{'p99 (us)':>12}{'mean (us)':>12}")
+    for name in ('sklearn', 'numpy_engine'):
+        r = results[name]
+        print(f"  {name:<14}{r['p50_us']:>12}{r['p99_us']:>12}{r['mean_us']:>12}")
+    print(f"  speedup: {results['speedup_p50']}x at p50, {results['speedup_p99']}x at p99")
+    print(f"Label agreement over {args.agreement_rows} rows: "
+          f"{batch_mismatches} batch / {single_mismatches} single-row mismatches")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Deployment configuration
+Settings come from, in increasing precedence: the defaults below, a JSON
+config file (path in HRP_CONFIG), and HRP_<FIELD> environment variables
+(e.g. HRP_DB_PATH, HRP_POOL_SIZE). The result is validated once at startup;
+a bad value stops the process with a ConfigError naming the setting.
+
+Relative paths from the config file resolve against the file's directory,
+relative paths from the environment against the working directory, and the
+defaults against the project directory.
+
+Example config file:
+    {
+        "db_path": "/var/lib/hrp/healthcare.db",
+        "model_dir": "/srv/hrp/models",
+        "sqlite_pragmas": {"cache_size": -64000, "mmap_size": 268435456},
+        "pool_size": 16,
+        "workers": 4
+    }
+"""
+
+import json
+import os
+import secrets
+from dataclasses import dataclass, field, fields, replace
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_PREFIX = 'HRP_'
+CONFIG_FILE_ENV = 'HRP_CONFIG'
+
+# Fields holding filesystem paths, resolved to absolute paths on load
+PATH_FIELDS = ('db_path', 'model_dir', 'legacy_model_dir', 'prediction_journal', 'archive_dir')
+
+# Pragmas that may be overridden, with the values each accepts (None: any integer)
+ALLOWED_PRAGMAS = {
+    'auto_vacuum': {'NONE', 'FULL', 'INCREMENTAL'},
+    'journal_mode': {'WAL', 'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY'},
+    'synchronous': {'OFF', 'NORMAL', 'FULL', 'EXTRA'},
+    'cache_size': None,
+    'temp_store': {'DEFAULT', 'FILE', 'MEMORY'},
+    'busy_timeout': None,
+    'mmap_size': None,
+    'wal_autocheckpoint': None,
+    'journal_size_limit': None
+}
+
+_TRUE = {'1', 'true', 'yes', 'on'}
+_FALSE = {'0', 'false', 'no', 'off', ''}
+
+
+class ConfigError(ValueError):
+    """An invalid or unknown configuration setting"""
+
+
+@dataclass(frozen=True)
+class Config:
+    # Database
+    db_path: str = os.path.join(BASE_DIR, 'healthcare.db')
+    pool_size: int = 8
+    pool_timeout: float = 10.0
+    # Overrides for database.SQLITE_PRAGMAS
+    sqlite_pragmas: dict = field(default_factory=dict)
+    # User records are cached per process; the TTL bounds staleness when another process edits users
+    user_cache_size: int = 4096
+    user_cache_ttl: float = 60.0
+    # Retention: `manage.py archive` moves predictions older than this many days
+    # into monthly files under archive_dir (0 = keep everything live)
+    retention_days: int = 0
+    archive_dir: str = os.path.join(BASE_DIR, 'archive')
+
+    # Models
+    model_dir: str = os.path.join(BASE_DIR, 'models')
+    legacy_model_dir: str = BASE_DIR
+    model_check_interval: float = 2.0
+    prediction_cache_size: int = 10000
+
+    # Web application
+    secret_key: str = ''
+    session_lifetime_hours: float = 12.0
+    max_batch_rows: int = 50000
+    history_page_size: int = 100
+    search_page_size: int = 25
+    # Rendered /dashboard and /history pages per viewer; the TTL bounds staleness from
+    # changes that do not touch predictions (e.g. a renamed user)
+    page_cache_size: int = 1024
+    page_cache_ttl: float = 300.0
+    login_workers: int = 2
+    login_max_pending: int = 16
+
+    # Write-behind persistence for /predict
+    write_behind: bool = False
+    prediction_journal: str = os.path.join(BASE_DIR, 'predictions.journal')
+    write_behind_interval: float = 0.05
+    write_behind_batch: int = 500
+    write_behind_fsync: bool = False
+
+    # serve.py
+    host: str = '0.0.0.0'
+    port: int = 8000
+    workers: int = 0  # 0 = one per CPU
+    threads: int = 8
+    graceful_timeout: float = 30.0
+
+    def validate(self):
+        """Raise ConfigError for the first out-of-range setting"""
+        positive = ('pool_size', 'user_cache_size', 'prediction_cache_size', 'max_batch_rows',
+                    'history_page_size', 'search_page_size', 'page_cache_size', 'login_workers',
+                    'login_max_pending', 'write_behind_batch', 'threads', 'session_lifetime_hours',
+                    'pool_timeout')
+        for name in positive:
+            if getattr(self, name) <= 0:
+                raise ConfigError(f'{name} must be positive, got {getattr(self, name)!r}')
+        non_negative = ('user_cache_ttl', 'page_cache_ttl', 'retention_days', 'model_check_interval',
+                        'write_behind_interval', 'workers', 'graceful_timeout')
+        for name in non_negative:
+            if getattr(self, name) < 0:
+                raise ConfigError(f'{name} must not be negative, got {getattr(self, name)!r}')
+        if not 0 < self.port < 65536:
+            raise ConfigError(f'port must be between 1 and 65535, got {self.port!r}')
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            raise ConfigError(f'db_path: directory {db_dir} does not exist')
+        for name, value in self.sqlite_pragmas.items():
+            if name not in ALLOWED_PRAGMAS:
+                raise ConfigError(f'sqlite_pragmas: unsupported pragma {name!r}')
+            allowed = ALLOWED_PRAGMAS[name]
+            if allowed is None:
+                if isinstance(value, bool) or not isinstance(value, int):
+                    raise ConfigError(f'sqlite_pragmas: {name} must be an integer, got {value!r}')
+            elif str(value).upper() not in allowed:
+                raise ConfigError(f'sqlite_pragmas: {name} must be one of {sorted(allowed)}, got {value!r}')
+        return self
+
+
+def _parse(name, kind, raw):
+    """Convert an environment string to the field's type"""
+    try:
+        if kind is bool:
+            text = raw.strip().lower()
+            if text in _TRUE:
+                return True
+            if text in _FALSE:
+                return False
+            raise ValueError(raw)
+        if kind is dict:
+            value = json.loads(raw)
+            if not isinstance(value, dict):
+                raise ValueError(raw)
+            return value
+        return kind(raw)
+    except ValueError:
+        raise ConfigError(f'{ENV_PREFIX}{name.upper()}: invalid {kind.__name__} {raw!r}') from None
+
+
+def _check_type(name, kind, value, source):
+    """Type-check a value read from the config file, allowing ints for floats"""
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ConfigError(f'{source}: {name} must be {kind.__name__}, got {value!r}')
+    return value
+
+
+def load_config(path=None, environ=None):
+    """Build and validate a Config from the config file and environment"""
+    environ = os.environ if environ is None else environ
+    path = path or environ.get(CONFIG_FILE_ENV)
+    kinds = {f.name: f.type for f in fields(Config)}
+    values = {}
+
+    if path:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f'Cannot read config file {path}: {e}') from None
+        if not isinstance(data, dict):
+            raise ConfigError(f'{path}: expected a JSON object')
+        unknown = sorted(set(data) - set(kinds))
+        if unknown:
+            raise ConfigError(f'{path}: unknown settings {", ".join(unknown)}')
+        base = os.path.dirname(os.path.abspath(path))
+        for name, value in data.items():
+            value = _check_type(name, kinds[name], value, path)
+            if name in PATH_FIELDS:
+                value = os.path.join(base, os.path.expanduser(value))
+            values[name] = value
+
+    for name, kind in kinds.items():
+        raw = environ.get(ENV_PREFIX + name.upper())
+        if raw is None:
+            continue
+        value = _parse(name, kind, raw)
+        if name in PATH_FIELDS:
+            value = os.path.abspath(os.path.expanduser(value))
+        values[name] = value
+
+    config = Config(**values)
+    if not config.secret_key:
+        # Fine for one process (forked workers inherit it); set HRP_SECRET_KEY in production
+        config = replace(config, secret_key=secrets.token_hex(32))
+    return config.validate()
+
+
+_config = None
+
+
+def get_config():
+    """The process-wide configuration, loaded on first use"""
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+
+def set_config(config):
+    """Replace the process-wide configuration (tools and benchmarks)"""
+    global _config
+    _config = config.validate()
+    return _config
@@ -1,202 +1,1561 @@
 import sqlite3
+import base64
+import re
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from metrics import Counter, Histogram, timed
+from cache import LRUCache
+from config import get_config
 
-class Database:
-    def __init__(self, db_name='healthcare.db'):
+PREDICTION_COLUMNS = (
+    'user_id', 'patient_name', 'age', 'room_number', 'billing_amount',
+    'gender', 'blood_type', 'medical_condition', 'admission_type',
+    'medication', 'insurance_provider', 'risk_level', 'model_version'
+)
+
+# Categorical text columns are dictionary-encoded: each distinct value is stored
+# once in vocab and referenced by its small integer id. Gender and blood type
+# belong to the patient; the rest describe the admission.
+PATIENT_CODED_FIELDS = ('gender', 'blood_type')
+PREDICTION_CODED_FIELDS = ('medical_condition', 'admission_type', 'medication', 'insurance_provider')
+CODED_FIELDS = PATIENT_CODED_FIELDS + PREDICTION_CODED_FIELDS
+
+# Layout of the predictions table itself; PREDICTION_COLUMNS rows are encoded into it
+STORED_PREDICTION_COLUMNS = (
+    'user_id', 'patient_id', 'age', 'room_number', 'billing_amount',
+    *(f'{field}_id' for field in PREDICTION_CODED_FIELDS),
+    'risk_level', 'model_version'
+)
+
+INSERT_PREDICTION_SQL = f'''
+    INSERT INTO predictions ({', '.join(STORED_PREDICTION_COLUMNS)})
+    VALUES ({', '.join('?' * len(STORED_PREDICTION_COLUMNS))})
+'''
+
+# Bulk loads supply created_at themselves
+BULK_INSERT_PREDICTION_SQL = f'''
+    INSERT INTO predictions ({', '.join(STORED_PREDICTION_COLUMNS)}, created_at)
+    VALUES ({', '.join('?' * (len(STORED_PREDICTION_COLUMNS) + 1))})
+'''
+
+# Readers select from this view, which decodes predictions back to the
+# PREDICTION_COLUMNS layout (plus id, created_at and the user's name)
+PREDICTION_DETAILS_VIEW = 'prediction_details'
+
+_COLUMN = {name: i for i, name in enumerate(PREDICTION_COLUMNS)}
+
+# Applied to every connection. WAL lets readers run alongside a writer;
+# synchronous=NORMAL is durable across application crashes in WAL mode.
+SQLITE_PRAGMAS = {
+    # Only takes effect on a new file or at the next full VACUUM; lets retention
+    # hand freed pages back with PRAGMA incremental_vacuum
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,  # negative = KiB, i.e. ~16 MB of page cache
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000
+}
+
+POOL_SIZE = 8
+# Seconds a request waits for a free pooled connection before failing
+POOL_TIMEOUT = 10.0
+STATEMENT_CACHE_SIZE = 256
+
+# patient (name, gender id, blood type id) -> patients.id entries kept in memory
+PATIENT_CACHE_SIZE = 100000
+
+# Longest gap between sweeps of expired sessions (see save_session)
+SESSION_PURGE_INTERVAL = 300
+
+# Hash for new and upgraded passwords; older hashes are rehashed on the next successful login
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+
+DB_QUERY_SECONDS = Histogram('hrp_db_query_seconds', 'Time spent in Database methods', ['operation'])
+DB_ERRORS = Counter('hrp_db_errors_total', 'Database method failures, including ones reported by a False return',
+                    ['operation'])
+DB_CONNECT_SECONDS = Histogram('hrp_db_connect_seconds', 'Time to open and configure a new SQLite connection')
+DB_POOL_WAIT_SECONDS = Histogram('hrp_db_pool_wait_seconds',
+                                 'Time spent blocked waiting for a free pooled connection')
+
+
+def instrumented(operation):
+    """Record a Database method's latency and the exceptions it raises"""
+    return timed(DB_QUERY_SECONDS, DB_ERRORS, operation=operation)
+
+# risk_counts row holding the totals across all users
+GLOBAL_STATS_ID = 0
+
+RISK_COUNT_COLUMNS = '''
+    COUNT(*),
+    COALESCE(SUM(risk_level = 'Low Risk'), 0),
+    COALESCE(SUM(risk_level = 'Medium Risk'), 0),
+    COALESCE(SUM(risk_level = 'High Risk'), 0)
+'''
+
+
+def rebuild_risk_counts(conn):
+    """Recompute the risk_counts summary table from predictions"""
+    conn.execute('DELETE FROM risk_counts')
+    conn.execute(f'''
+        INSERT INTO risk_counts (user_id, total_predictions, low_risk, medium_risk, high_risk)
+        SELECT {GLOBAL_STATS_ID}, {RISK_COUNT_COLUMNS} FROM predictions
+    ''')
+    conn.execute(f'''
+        INSERT INTO risk_counts (user_id, total_predictions, low_risk, medium_risk, high_risk)
+        SELECT user_id, {RISK_COUNT_COLUMNS} FROM predictions GROUP BY user_id
+    ''')
+
+
+# Keep risk_counts in step with predictions inside the writing transaction
+RISK_COUNT_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_predictions_count_insert AFTER INSERT ON predictions
+    BEGIN
+        INSERT INTO risk_counts (user_id, total_predictions, low_risk, medium_risk, high_risk)
+        VALUES
+            ({GLOBAL_STATS_ID}, 1, NEW.risk_level = 'Low Risk', NEW.risk_level = 'Medium Risk', NEW.risk_level = 'High Risk'),
+            (NEW.user_id, 1, NEW.risk_level = 'Low Risk', NEW.risk_level = 'Medium Risk', NEW.risk_level = 'High Risk')
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_predictions = total_predictions + 1,
+            low_risk = low_risk + excluded.low_risk,
+            medium_risk = medium_risk + excluded.medium_risk,
+            high_risk = high_risk + excluded.high_risk;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_predictions_count_delete AFTER DELETE ON predictions
+    BEGIN
+        UPDATE risk_counts SET
+            total_predictions = total_predictions - 1,
+            low_risk = low_risk - (OLD.risk_level = 'Low Risk'),
+            medium_risk = medium_risk - (OLD.risk_level = 'Medium Risk'),
+            high_risk = high_risk - (OLD.risk_level = 'High Risk')
+        WHERE user_id IN ({GLOBAL_STATS_ID}, OLD.user_id);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_predictions_count_update AFTER UPDATE OF user_id, risk_level ON predictions
+    BEGIN
+        UPDATE risk_counts SET
+            total_predictions = total_predictions - 1,
+            low_risk = low_risk - (OLD.risk_level = 'Low Risk'),
+            medium_risk = medium_risk - (OLD.risk_level = 'Medium Risk'),
+            high_risk = high_risk - (OLD.risk_level = 'High Risk')
+        WHERE user_id IN ({GLOBAL_STATS_ID}, OLD.user_id);
+        INSERT INTO risk_counts (user_id, total_predictions, low_risk, medium_risk, high_risk)
+        VALUES
+            ({GLOBAL_STATS_ID}, 1, NEW.risk_level = 'Low Risk', NEW.risk_level = 'Medium Risk', NEW.risk_level = 'High Risk'),
+            (NEW.user_id, 1, NEW.risk_level = 'Low Risk', NEW.risk_level = 'Medium Risk', NEW.risk_level = 'High Risk')
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_predictions = total_predictions + 1,
+            low_risk = low_risk + excluded.low_risk,
+            medium_risk = medium_risk + excluded.medium_risk,
+            high_risk = high_risk + excluded.high_risk;
+    END
+    '''
+]
+
+# Trend rollups: risk counts per time bucket, user (GLOBAL_STATS_ID = everyone),
+# medical condition and admission type, kept current by triggers like risk_counts.
+# table -> (bucket expression over a row alias {row}, also kept per user).
+# Hourly buckets per user would be nearly as many rows as predictions, so
+# the hourly table only holds the everyone rows.
+ROLLUP_BUCKETS = {
+    'risk_rollup_hourly': ("substr({row}.created_at, 1, 13) || ':00'", False),
+    'risk_rollup_daily': ("substr({row}.created_at, 1, 10)", True)
+}
+ROLLUP_KEY = ('bucket', 'user_id', 'medical_condition_id', 'admission_type_id')
+
+
+def _rollup_table_sql(table):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            medical_condition_id INTEGER NOT NULL,
+            admission_type_id INTEGER NOT NULL,
+            total_predictions INTEGER NOT NULL DEFAULT 0,
+            low_risk INTEGER NOT NULL DEFAULT 0,
+            medium_risk INTEGER NOT NULL DEFAULT 0,
+            high_risk INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, user_id, medical_condition_id, admission_type_id)
+        ) WITHOUT ROWID
+    '''
+
+
+def _rollup_add_sql(table, row):
+    """Count one prediction (NEW or OLD) into its global and per-user buckets"""
+    bucket, per_user = ROLLUP_BUCKETS[table]
+    bucket = bucket.format(row=row)
+    levels = ', '.join(f"{row}.risk_level = '{label}'" for label in ('Low Risk', 'Medium Risk', 'High Risk'))
+    codes = f'COALESCE({row}.medical_condition_id, 0), COALESCE({row}.admission_type_id, 0)'
+    users = [str(GLOBAL_STATS_ID)] + ([f'{row}.user_id'] if per_user else [])
+    values = ',\n'.join(f'({bucket}, {user}, {codes}, 1, {levels})' for user in users)
+    return f'''
+        INSERT INTO {table} ({', '.join(ROLLUP_KEY)}, total_predictions, low_risk, medium_risk, high_risk)
+        VALUES {values}
+        ON CONFLICT ({', '.join(ROLLUP_KEY)}) DO UPDATE SET
+            total_predictions = total_predictions + 1,
+            low_risk = low_risk + excluded.low_risk,
+            medium_risk = medium_risk + excluded.medium_risk,
+            high_risk = high_risk + excluded.high_risk;
+    '''
+
+
+def _rollup_remove_sql(table, row):
+    """Take one prediction out of its buckets, dropping buckets that become empty"""
+    bucket, per_user = ROLLUP_BUCKETS[table]
+    users = f'{GLOBAL_STATS_ID}, {row}.user_id' if per_user else str(GLOBAL_STATS_ID)
+    where = f'''
+        bucket = {bucket.format(row=row)}
+        AND user_id IN ({users})
+        AND medical_condition_id = COALESCE({row}.medical_condition_id, 0)
+        AND admission_type_id = COALESCE({row}.admission_type_id, 0)
+    '''
+    return f'''
+        UPDATE {table} SET
+            total_predictions = total_predictions - 1,
+            low_risk = low_risk - ({row}.risk_level = 'Low Risk'),
+            medium_risk = medium_risk - ({row}.risk_level = 'Medium Risk'),
+            high_risk = high_risk - ({row}.risk_level = 'High Risk')
+        WHERE {where};
+        DELETE FROM {table} WHERE total_predictions = 0 AND {where};
+    '''
+
+
+def rollup_triggers(table):
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_predictions_{table}_insert AFTER INSERT ON predictions
+        BEGIN {_rollup_add_sql(table, 'NEW')} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_predictions_{table}_delete AFTER DELETE ON predictions
+        BEGIN {_rollup_remove_sql(table, 'OLD')} END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_predictions_{table}_update
+        AFTER UPDATE OF user_id, risk_level, created_at, medical_condition_id, admission_type_id ON predictions
+        BEGIN {_rollup_remove_sql(table, 'OLD')} {_rollup_add_sql(table, 'NEW')} END
+        '''
+    ]
+
+
+def rebuild_risk_rollups(conn):
+    """Recompute the trend rollup tables from predictions"""
+    for table, (bucket, per_user) in ROLLUP_BUCKETS.items():
+        conn.execute(f'DELETE FROM {table}')
+        for user in (str(GLOBAL_STATS_ID), 'p.user_id')[:2 if per_user else 1]:
+            conn.execute(f'''
+                INSERT INTO {table} ({', '.join(ROLLUP_KEY)}, total_predictions, low_risk, medium_risk, high_risk)
+                SELECT {bucket.format(row='p')}, {user},
+                       COALESCE(p.medical_condition_id, 0), COALESCE(p.admission_type_id, 0),
+                       {RISK_COUNT_COLUMNS}
+                FROM predictions p
+                GROUP BY 1, 2, 3, 4
+            ''')
+
+
+# Retention moves old predictions out of the table without taking them out of
+# the dashboard counts or trends: ids being archived are listed in
+# archive_batch, whose deletes skip the count and rollup triggers, and their
+# counts are kept in archived_* copies of the rollup tables so rebuilds can
+# add them back.
+ARCHIVE_BATCH_TABLE = 'archive_batch'
+ARCHIVED_ROLLUPS = {table: f'archived_{table}' for table in ROLLUP_BUCKETS}
+_NOT_ARCHIVING = f'WHEN OLD.id NOT IN (SELECT id FROM {ARCHIVE_BATCH_TABLE})'
+
+
+def archive_aware_delete_triggers():
+    """Delete triggers for risk_counts and the rollups that ignore archived rows"""
+    triggers = [f'''
+        CREATE TRIGGER IF NOT EXISTS trg_predictions_count_delete AFTER DELETE ON predictions
+        {_NOT_ARCHIVING}
+        BEGIN
+            UPDATE risk_counts SET
+                total_predictions = total_predictions - 1,
+                low_risk = low_risk - (OLD.risk_level = 'Low Risk'),
+                medium_risk = medium_risk - (OLD.risk_level = 'Medium Risk'),
+                high_risk = high_risk - (OLD.risk_level = 'High Risk')
+            WHERE user_id IN ({GLOBAL_STATS_ID}, OLD.user_id);
+        END
+        ''']
+    for table in ROLLUP_BUCKETS:
+        triggers.append(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_predictions_{table}_delete AFTER DELETE ON predictions
+        {_NOT_ARCHIVING}
+        BEGIN {_rollup_remove_sql(table, 'OLD')} END
+        ''')
+    return triggers
+
+
+def _add_rollup_rows_sql(table, select):
+    """Upsert (bucket, user, codes, counts) rows from `select` into a rollup table"""
+    return f'''
+        INSERT INTO {table} ({', '.join(ROLLUP_KEY)}, total_predictions, low_risk, medium_risk, high_risk)
+        {select} WHERE true
+        ON CONFLICT ({', '.join(ROLLUP_KEY)}) DO UPDATE SET
+            total_predictions = total_predictions + excluded.total_predictions,
+            low_risk = low_risk + excluded.low_risk,
+            medium_risk = medium_risk + excluded.medium_risk,
+            high_risk = high_risk + excluded.high_risk
+    '''
+
+
+def record_archived_counts(conn):
+    """Add the predictions listed in archive_batch to the archived rollup tables"""
+    for table, (bucket, per_user) in ROLLUP_BUCKETS.items():
+        for user in (str(GLOBAL_STATS_ID), 'p.user_id')[:2 if per_user else 1]:
+            conn.execute(_add_rollup_rows_sql(ARCHIVED_ROLLUPS[table], f'''
+                SELECT * FROM (
+                    SELECT {bucket.format(row='p')}, {user},
+                           COALESCE(p.medical_condition_id, 0), COALESCE(p.admission_type_id, 0),
+                           {RISK_COUNT_COLUMNS}
+                    FROM predictions p
+                    WHERE p.id IN (SELECT id FROM {ARCHIVE_BATCH_TABLE})
+                    GROUP BY 1, 2, 3, 4
+                )
+            '''))
+
+
+def add_archived_counts(conn):
+    """Add archived predictions back into freshly rebuilt risk_counts"""
+    conn.execute(f'''
+        INSERT INTO risk_counts (user_id, total_predictions, low_risk, medium_risk, high_risk)
+        SELECT user_id, SUM(total_predictions), SUM(low_risk), SUM(medium_risk), SUM(high_risk)
+        FROM {ARCHIVED_ROLLUPS['risk_rollup_daily']}
+        WHERE true
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_predictions = total_predictions + excluded.total_predictions,
+            low_risk = low_risk + excluded.low_risk,
+            medium_risk = medium_risk + excluded.medium_risk,
+            high_risk = high_risk + excluded.high_risk
+    ''')
+
+
+def add_archived_rollups(conn):
+    """Add archived predictions back into freshly rebuilt rollup tables"""
+    for table, archived in ARCHIVED_ROLLUPS.items():
+        conn.execute(_add_rollup_rows_sql(table, f'''
+            SELECT {', '.join(ROLLUP_KEY)}, total_predictions, low_risk, medium_risk, high_risk
+            FROM {archived}
+        '''))
+
+
+# Patient search: an FTS5 index over patient names (external content on
+# patients, kept in sync by triggers). Categorical fields are matched against
+# the small vocab table instead, so they need no index of their own.
+PATIENT_SEARCH_TABLE = 'patient_search'
+SEARCH_TOKEN = re.compile(r'[\w+-]*\w[\w+-]*')
+MAX_SEARCH_TERMS = 8
+
+PATIENT_SEARCH_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_patients_search_insert AFTER INSERT ON patients
+    BEGIN
+        INSERT INTO {PATIENT_SEARCH_TABLE} (rowid, name) VALUES (NEW.id, NEW.name);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_patients_search_delete AFTER DELETE ON patients
+    BEGIN
+        INSERT INTO {PATIENT_SEARCH_TABLE} ({PATIENT_SEARCH_TABLE}, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_patients_search_update AFTER UPDATE OF name ON patients
+    BEGIN
+        INSERT INTO {PATIENT_SEARCH_TABLE} ({PATIENT_SEARCH_TABLE}, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        INSERT INTO {PATIENT_SEARCH_TABLE} (rowid, name) VALUES (NEW.id, NEW.name);
+    END
+    '''
+]
+
+
+def search_terms(text):
+    """Lower-cased words of a search query or categorical value ("AB+" is one word)"""
+    return SEARCH_TOKEN.findall(text.lower())
+
+
+def _name_query(term):
+    """FTS prefix query for one search word, or None if it cannot be part of a name"""
+    if '+' in term or term.endswith('-'):
+        return None
+    # Quoted, so FTS syntax in user input is just text; "smith-jones" becomes a phrase
+    return f'"{term}"*'
+
+
+def _vocab_id_sql(field, value_sql):
+    return f"(SELECT id FROM vocab WHERE field = '{field}' AND value = {value_sql})"
+
+
+def normalize_predictions(conn):
+    """Rebuild predictions with vocab ids for categoricals and one patients row
+    per distinct patient, preserving ids and the AUTOINCREMENT sequence"""
+    for field in CODED_FIELDS:
+        conn.execute(f'''
+            INSERT OR IGNORE INTO vocab (field, value)
+            SELECT DISTINCT ?, {field} FROM predictions WHERE {field} IS NOT NULL
+        ''', (field,))
+    gender_id = f"COALESCE({_vocab_id_sql('gender', 'p.gender')}, 0)"
+    blood_type_id = f"COALESCE({_vocab_id_sql('blood_type', 'p.blood_type')}, 0)"
+    conn.execute(f'''
+        INSERT OR IGNORE INTO patients (name, gender_id, blood_type_id)
+        SELECT DISTINCT COALESCE(p.patient_name, ''), {gender_id}, {blood_type_id}
+        FROM predictions p
+    ''')
+    
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'predictions'").fetchone()
+    conn.execute('''
+        CREATE TABLE predictions_compact (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            patient_id INTEGER NOT NULL,
+            age INTEGER NOT NULL,
+            room_number INTEGER NOT NULL,
+            billing_amount REAL NOT NULL,
+            medical_condition_id INTEGER,
+            admission_type_id INTEGER,
+            medication_id INTEGER,
+            insurance_provider_id INTEGER,
+            risk_level TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            model_version TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (patient_id) REFERENCES patients (id)
+        )
+    ''')
+    codes = ', '.join(_vocab_id_sql(field, f'p.{field}') for field in PREDICTION_CODED_FIELDS)
+    conn.execute(f'''
+        INSERT INTO predictions_compact (id, {', '.join(STORED_PREDICTION_COLUMNS)}, created_at)
+        SELECT p.id, p.user_id, pt.id, p.age, p.room_number, p.billing_amount, {codes},
+               p.risk_level, p.model_version, p.created_at
+        FROM predictions p
+        JOIN patients pt
+          ON pt.name = COALESCE(p.patient_name, '')
+         AND pt.gender_id = {gender_id}
+         AND pt.blood_type_id = {blood_type_id}
+    ''')
+    # Dropping the table also drops its indexes and risk_counts triggers; the migration recreates them
+    conn.execute('DROP TABLE predictions')
+    conn.execute('ALTER TABLE predictions_compact RENAME TO predictions')
+    if sequence is not None:
+        # Never hand out an id again that belonged to a deleted row
+        updated = conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'predictions'",
+                               (sequence[0],)).rowcount
+        if not updated:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('predictions', ?)", (sequence[0],))
+
+
+# Data versions: a counter per user (and GLOBAL_STATS_ID for everyone) bumped
+# whenever that user's predictions change, however they were written. Pages
+# built from predictions use it for ETags and their rendered-page cache.
+def _data_version_bump_sql(*rows):
+    """Bump the global version and that of each user in `rows`"""
+    values = ', '.join(f'({user}, 1, CURRENT_TIMESTAMP)' for user in (GLOBAL_STATS_ID, *rows))
+    return f'''
+        INSERT INTO data_versions (user_id, version, updated_at)
+        VALUES {values}
+        ON CONFLICT (user_id) DO UPDATE SET
+            version = version + 1,
+            updated_at = excluded.updated_at;
+    '''
+
+
+DATA_VERSION_TRIGGERS = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_predictions_version_insert AFTER INSERT ON predictions
+    BEGIN {_data_version_bump_sql('NEW.user_id')} END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_predictions_version_delete AFTER DELETE ON predictions
+    BEGIN {_data_version_bump_sql('OLD.user_id')} END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_predictions_version_update AFTER UPDATE ON predictions
+    BEGIN {_data_version_bump_sql('OLD.user_id', 'NEW.user_id')} END
+    '''
+]
+
+
+# Schema migrations, applied in order on startup and tracked with PRAGMA user_version.
+# Each step is an SQL statement or a callable taking the connection.
+# Append new versions; never edit one that has already shipped.
+MIGRATIONS = [
+    (1, 'Index predictions for dashboard and history queries', [
+        'CREATE INDEX IF NOT EXISTS idx_predictions_created ON predictions (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_predictions_user_created ON predictions (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_predictions_user_risk ON predictions (user_id, risk_level)',
+        'CREATE INDEX IF NOT EXISTS idx_predictions_risk ON predictions (risk_level)'
+    ]),
+    (2, 'Maintain per-user and global risk counts for dashboard statistics', [
+        '''
+        CREATE TABLE IF NOT EXISTS risk_counts (
+            user_id INTEGER PRIMARY KEY,
+            total_predictions INTEGER NOT NULL DEFAULT 0,
+            low_risk INTEGER NOT NULL DEFAULT 0,
+            medium_risk INTEGER NOT NULL DEFAULT 0,
+            high_risk INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        *RISK_COUNT_TRIGGERS,
+        rebuild_risk_counts,
+        # Statistics no longer aggregate over predictions
+        'DROP INDEX IF EXISTS idx_predictions_user_risk',
+        'DROP INDEX IF EXISTS idx_predictions_risk'
+    ]),
+    (3, 'Record the model version behind each prediction', [
+        'ALTER TABLE predictions ADD COLUMN model_version TEXT'
+    ]),
+    (4, 'Store login sessions server-side so they can be revoked', [
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER,
+            data TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)'
+    ]),
+    (5, 'Record how far each write-behind journal has been committed', [
+        '''
+        CREATE TABLE IF NOT EXISTS journal_checkpoints (
+            journal TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL
+        )
+        '''
+    ]),
+    (6, 'Dictionary-encode categorical columns and store each patient once', [
+        '''
+        CREATE TABLE IF NOT EXISTS vocab (
+            id INTEGER PRIMARY KEY,
+            field TEXT NOT NULL,
+            value TEXT NOT NULL,
+            UNIQUE (field, value)
+        )
+        ''',
+        # 0 = not recorded, so the UNIQUE constraint also covers patients without them
+        '''
+        CREATE TABLE IF NOT EXISTS patients (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            gender_id INTEGER NOT NULL DEFAULT 0,
+            blood_type_id INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (name, gender_id, blood_type_id)
+        )
+        ''',
+        normalize_predictions,
+        'CREATE INDEX IF NOT EXISTS idx_predictions_created ON predictions (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_predictions_user_created ON predictions (user_id, created_at)',
+        *RISK_COUNT_TRIGGERS,
+        f'''
+        CREATE VIEW IF NOT EXISTS {PREDICTION_DETAILS_VIEW} AS
+        SELECT
+            p.id, p.user_id, NULLIF(pt.name, '') AS patient_name,
+            p.age, p.room_number, p.billing_amount,
+            g.value AS gender, b.value AS blood_type,
+            mc.value AS medical_condition, adm.value AS admission_type,
+            med.value AS medication, ins.value AS insurance_provider,
+            p.risk_level, p.created_at, p.model_version,
+            u.full_name AS user_name
+        FROM predictions p
+        JOIN users u ON u.id = p.user_id
+        JOIN patients pt ON pt.id = p.patient_id
+        LEFT JOIN vocab g ON g.id = pt.gender_id
+        LEFT JOIN vocab b ON b.id = pt.blood_type_id
+        LEFT JOIN vocab mc ON mc.id = p.medical_condition_id
+        LEFT JOIN vocab adm ON adm.id = p.admission_type_id
+        LEFT JOIN vocab med ON med.id = p.medication_id
+        LEFT JOIN vocab ins ON ins.id = p.insurance_provider_id
+        '''
+    ]),
+    (7, 'Roll risk counts up into hourly and daily trend buckets', [
+        *(_rollup_table_sql(table) for table in ROLLUP_BUCKETS),
+        *(trigger for table in ROLLUP_BUCKETS for trigger in rollup_triggers(table)),
+        rebuild_risk_rollups
+    ]),
+    (8, 'Index patient names for search', [
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {PATIENT_SEARCH_TABLE} USING fts5(
+            name, content='patients', content_rowid='id', prefix='2 3'
+        )
+        ''',
+        *PATIENT_SEARCH_TRIGGERS,
+        f"INSERT INTO {PATIENT_SEARCH_TABLE} ({PATIENT_SEARCH_TABLE}) VALUES ('rebuild')",
+        # Predictions of the matching patients, newest first
+        'CREATE INDEX IF NOT EXISTS idx_predictions_patient_created ON predictions (patient_id, created_at)'
+    ]),
+    (9, 'Version each user\'s predictions for HTTP caching', [
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP
+        )
+        ''',
+        *DATA_VERSION_TRIGGERS,
+        f'''
+        INSERT OR REPLACE INTO data_versions (user_id, version, updated_at)
+        SELECT {GLOBAL_STATS_ID}, 1, MAX(created_at) FROM predictions
+        UNION ALL
+        SELECT user_id, 1, MAX(created_at) FROM predictions GROUP BY user_id
+        '''
+    ]),
+    (10, 'Keep archived predictions in dashboard counts and trends', [
+        f'CREATE TABLE IF NOT EXISTS {ARCHIVE_BATCH_TABLE} (id INTEGER PRIMARY KEY)',
+        *(_rollup_table_sql(table) for table in ARCHIVED_ROLLUPS.values()),
+        'DROP TRIGGER IF EXISTS trg_predictions_count_delete',
+        *(f'DROP TRIGGER IF EXISTS trg_predictions_{table}_delete' for table in ROLLUP_BUCKETS),
+        *archive_aware_delete_triggers()
+    ])
+]
+
+# /api/trends: bucket expression and rollup table per granularity (weeks start on Monday)
+TREND_GRANULARITIES = {
+    'hour': ('risk_rollup_hourly', 'r.bucket'),
+    'day': ('risk_rollup_daily', 'r.bucket'),
+    'week': ('risk_rollup_daily', "date(r.bucket, 'weekday 0', '-6 days')")
+}
+
+# Breakdown dimension -> (rollup key column, label expression, join)
+TREND_GROUPS = {
+    'medical_condition': ('r.medical_condition_id', 'g.value',
+                          'LEFT JOIN vocab g ON g.id = r.medical_condition_id'),
+    'admission_type': ('r.admission_type_id', 'g.value', 'LEFT JOIN vocab g ON g.id = r.admission_type_id'),
+    'user': ('r.user_id', 'g.full_name', 'LEFT JOIN users g ON g.id = r.user_id')
+}
+
+# Queries behind /dashboard and /history, checked by check_query_plans()
+HOT_QUERIES = {
+    'recent_predictions': ('''
+        SELECT p.*
+        FROM prediction_details p
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', (10,)),
+    'recent_predictions_for_user': ('''
+        SELECT p.*
+        FROM prediction_details p
+        WHERE p.user_id = ?
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', (1, 10)),
+    'history_page': ('''
+        SELECT p.*
+        FROM prediction_details p
+        WHERE (p.created_at, p.id) < (?, ?)
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', ('2024-01-01 00:00:00', 1, 101)),
+    'history_page_for_user': ('''
+        SELECT p.*
+        FROM prediction_details p
+        WHERE p.user_id = ? AND (p.created_at, p.id) < (?, ?)
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', (1, '2024-01-01 00:00:00', 1, 101)),
+    'statistics': ('''
+        SELECT total_predictions, low_risk, medium_risk, high_risk
+        FROM risk_counts
+        WHERE user_id = ?
+    ''', (GLOBAL_STATS_ID,)),
+    'statistics_for_user': ('''
+        SELECT total_predictions, low_risk, medium_risk, high_risk
+        FROM risk_counts
+        WHERE user_id = ?
+    ''', (1,))
+}
+
+
+def prediction_filters(user_id=None, risk_level=None, date_from=None, date_to=None,
+                       medical_condition=None):
+    """WHERE clauses and parameters shared by prediction listings (rows aliased p)"""
+    clauses, params = [], []
+    if user_id:
+        clauses.append('p.user_id = ?')
+        params.append(user_id)
+    if risk_level:
+        clauses.append('p.risk_level = ?')
+        params.append(risk_level)
+    if medical_condition:
+        clauses.append('p.medical_condition = ?')
+        params.append(medical_condition)
+    if date_from:
+        clauses.append('p.created_at >= ?')
+        params.append(date_from)
+    if date_to:
+        # Inclusive of the whole final day
+        clauses.append("p.created_at < date(?, '+1 day')")
+        params.append(date_to)
+    return clauses, params
+
+
+def encode_cursor(prediction):
+    """Opaque pagination cursor for a prediction's (created_at, id) position"""
+    raw = f"{prediction['created_at']}|{prediction['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, prediction_id = raw.rsplit('|', 1)
+        return created_at, int(prediction_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class ConnectionPool:
+    """Thread-safe pool of reusable SQLite connections"""
+    
+    def __init__(self, db_name, size=POOL_SIZE, pragmas=None, statement_cache_size=STATEMENT_CACHE_SIZE,
+                 timeout=POOL_TIMEOUT):
         self.db_name = db_name
-        self.init_db()
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+        self.statement_cache_size = statement_cache_size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
     
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_name)
+    def connect(self):
+        """Open a new connection with the pool's pragmas applied"""
+        with DB_CONNECT_SECONDS.time():
+            return self._connect()
+    
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size
+        )
         conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
         return conn
     
-    def init_db(self):
-        """Initialize database tables"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL,
-                full_name TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    def acquire(self, timeout=None):
+        """Take an idle connection, opening a new one while under the size limit.
         
-        # Predictions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS predictions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                patient_name TEXT,
-                age INTEGER NOT NULL,
-                room_number INTEGER NOT NULL,
-                billing_amount REAL NOT NULL,
-                gender TEXT,
-                blood_type TEXT,
-                medical_condition TEXT,
-                admission_type TEXT,
-                medication TEXT,
-                insurance_provider TEXT,
-                risk_level TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+        Waits at most `timeout` seconds (default: the pool's) for one to be
+        released, then raises sqlite3.OperationalError.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self.connect()
+                self._connections.append(conn)
+                return conn
         
-        conn.commit()
-        conn.close()
+        try:
+            with DB_POOL_WAIT_SECONDS.time():
+                return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f'Timed out after {timeout:g}s waiting for one of {self.size} pooled database connections')
     
-    def create_user(self, username, email, password, role, full_name):
-        """Create a new user"""
+    def release(self, conn):
+        """Return a connection to the pool, discarding any unfinished transaction"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block.
+        
+        Nested borrows on the same thread reuse the connection already held.
+        """
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        
+        conn = self.acquire()
+        self._local.conn = conn
         try:
-            conn = self.get_connection()
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self.release(conn)
+    
+    def close(self):
+        """Close every connection the pool has opened"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._idle = queue.LifoQueue()
+        for conn in connections:
+            conn.close()
+
+
+class Database:
+    def __init__(self, db_name=None, pool_size=None, config=None):
+        """Open (and migrate) the database; unset arguments come from the deployment config"""
+        config = config or get_config()
+        self.db_name = db_name or config.db_path
+        self.pool = ConnectionPool(
+            self.db_name,
+            size=pool_size or config.pool_size,
+            pragmas={**SQLITE_PRAGMAS, **config.sqlite_pragmas},
+            timeout=config.pool_timeout
+        )
+        self.user_cache = LRUCache(config.user_cache_size, config.user_cache_ttl)
+        # Lookup ids never change once committed, so these need no expiry
+        self.vocab_cache = {}
+        self.patient_cache = LRUCache(PATIENT_CACHE_SIZE)
+        self._next_session_purge = 0.0
+        self.init_db()
+    
+    def get_connection(self):
+        """Open a standalone connection (caller closes it)"""
+        return self.pool.connect()
+    
+    def connection(self):
+        """Borrow a pooled connection: `with db.connection() as conn: ...`"""
+        return self.pool.connection()
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.close()
+    
+    def init_db(self):
+        """Initialize database tables"""
+        with self.connection() as conn:
             cursor = conn.cursor()
-            password_hash = generate_password_hash(password)
             
+            # Users table
             cursor.execute('''
-                INSERT INTO users (username, email, password_hash, role, full_name)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (username, email, password_hash, role, full_name))
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    email TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    full_name TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Predictions table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS predictions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    patient_name TEXT,
+                    age INTEGER NOT NULL,
+                    room_number INTEGER NOT NULL,
+                    billing_amount REAL NOT NULL,
+                    gender TEXT,
+                    blood_type TEXT,
+                    medical_condition TEXT,
+                    admission_type TEXT,
+                    medication TEXT,
+                    insurance_provider TEXT,
+                    risk_level TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
             
             conn.commit()
-            user_id = cursor.lastrowid
-            conn.close()
+        
+        self.migrate()
+    
+    def schema_version(self):
+        """Current schema version recorded in the database file"""
+        with self.connection() as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    @instrumented('migrate')
+    def migrate(self):
+        """Apply pending schema migrations, each in its own transaction"""
+        applied = []
+        with self.connection() as conn:
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            for version, description, steps in MIGRATIONS:
+                if version <= current:
+                    continue
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    # Another process may have migrated while we waited for the lock
+                    if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                        conn.rollback()
+                        continue
+                    for step in steps:
+                        if callable(step):
+                            step(conn)
+                        else:
+                            conn.execute(step)
+                    conn.execute(f'PRAGMA user_version = {version}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append((version, description))
+        return applied
+    
+    def explain(self, sql, params=()):
+        """EXPLAIN QUERY PLAN details for a query"""
+        with self.connection() as conn:
+            return [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+    
+    def check_query_plans(self):
+        """Verify the hot queries are served from indexes.
+        
+        Returns {name: (ok, plan)}; a plan fails if it scans a table without
+        an index or sorts through a temporary B-tree.
+        """
+        results = {}
+        for name, (sql, params) in HOT_QUERIES.items():
+            plan = self.explain(sql, params)
+            full_scan = any(detail.startswith('SCAN') and 'INDEX' not in detail for detail in plan)
+            temp_sort = any('TEMP B-TREE' in detail for detail in plan)
+            results[name] = (not full_scan and not temp_sort, plan)
+        return results
+    
+    @instrumented('create_user')
+    def create_user(self, username, email, password, role, full_name):
+        """Create a new user"""
+        try:
+            password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO users (username, email, password_hash, role, full_name)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (username, email, password_hash, role, full_name))
+                
+                conn.commit()
+            self.invalidate_user(username=username)
             return True, "User created successfully"
         except sqlite3.IntegrityError:
             return False, "Username or email already exists"
         except Exception as e:
+            DB_ERRORS.labels(operation='create_user').inc()
             return False, str(e)
     
+    @instrumented('verify_user')
     def verify_user(self, username, password):
         """Verify user credentials"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-        user = cursor.fetchone()
-        conn.close()
+        user = self.get_user_by_username(username)
         
         if user and check_password_hash(user['password_hash'], password):
-            return True, dict(user)
+            return True, user
         return False, None
     
+    @instrumented('update_password_hash')
+    def update_password_hash(self, user_id, password_hash):
+        """Replace a user's stored password hash"""
+        with self.connection() as conn:
+            conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
+            conn.commit()
+        self.invalidate_user(user_id=user_id)
+    
+    def _cache_user(self, user):
+        """Cache a user record under both its id and its username"""
+        self.user_cache.set(('id', user['id']), user)
+        self.user_cache.set(('username', user['username']), user)
+    
+    def invalidate_user(self, user_id=None, username=None):
+        """Drop cached copies of a user (and the user listing) after a change"""
+        for key in (('id', user_id), ('username', username)):
+            user = self.user_cache.pop(key)
+            if user is not None:
+                self.user_cache.pop(('id', user['id']))
+                self.user_cache.pop(('username', user['username']))
+        self.user_cache.pop(('all',))
+    
+    def _lookup_user(self, key, sql, value):
+        user = self.user_cache.get(key)
+        if user is None:
+            with self.connection() as conn:
+                row = conn.execute(sql, (value,)).fetchone()
+            if row is None:
+                return None
+            user = dict(row)
+            self._cache_user(user)
+        # Callers get their own copy so they cannot alter the cached record
+        return dict(user)
+    
+    @instrumented('get_user_by_id')
     def get_user_by_id(self, user_id):
         """Get user by ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        return self._lookup_user(('id', user_id), 'SELECT * FROM users WHERE id = ?', user_id)
+    
+    @instrumented('get_user_by_username')
+    def get_user_by_username(self, username):
+        """Get user by username"""
+        return self._lookup_user(('username', username), 'SELECT * FROM users WHERE username = ?', username)
+    
+    def prediction_row(self, user_id, patient_data, risk_level, model_version=None):
+        """Flatten patient data into a predictions INSERT parameter tuple"""
+        return (
+            user_id,
+            patient_data.get('patient_name') or 'Unknown',
+            patient_data['age'],
+            patient_data['room_number'],
+            patient_data['billing_amount'],
+            patient_data.get('gender'),
+            patient_data.get('blood_type'),
+            patient_data.get('medical_condition'),
+            patient_data.get('admission_type'),
+            patient_data.get('medication'),
+            patient_data.get('insurance_provider'),
+            risk_level,
+            model_version
+        )
+    
+    def encode_predictions(self, conn, rows):
+        """Convert PREDICTION_COLUMNS rows (optionally + created_at) to the stored layout.
+        
+        Works column by column and looks up each distinct value or patient
+        once. Values and patients seen for the first time are inserted and
+        committed right away, so cached ids never point at rows a later
+        rollback removes; call it before the transaction's own writes.
+        """
+        if not rows:
+            return []
+        columns = list(zip(*rows))
+        distinct = {field: set(columns[_COLUMN[field]]) - {None} for field in CODED_FIELDS}
+        
+        vocab = self.vocab_cache
+        new_values = [(field, value) for field in CODED_FIELDS for value in distinct[field]
+                      if (field, value) not in vocab]
+        if new_values:
+            conn.executemany('INSERT OR IGNORE INTO vocab (field, value) VALUES (?, ?)', new_values)
+            vocab = dict(vocab)
+            for key in new_values:
+                vocab[key] = conn.execute('SELECT id FROM vocab WHERE field = ? AND value = ?', key).fetchone()[0]
+        
+        codes = {}
+        for field in CODED_FIELDS:
+            lookup = {value: vocab[(field, value)] for value in distinct[field]}
+            lookup[None] = None
+            codes[field] = list(map(lookup.__getitem__, columns[_COLUMN[field]]))
         
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
+        patient_keys = list(zip(
+            [name or '' for name in columns[_COLUMN['patient_name']]],
+            [code or 0 for code in codes['gender']],
+            [code or 0 for code in codes['blood_type']]
+        ))
+        patients, new_patients = {}, []
+        for key in set(patient_keys):
+            patient_id = self.patient_cache.get(key)
+            if patient_id is None:
+                new_patients.append(key)
+            else:
+                patients[key] = patient_id
+        if new_patients:
+            conn.executemany('INSERT OR IGNORE INTO patients (name, gender_id, blood_type_id) VALUES (?, ?, ?)',
+                             new_patients)
+            for key in new_patients:
+                patients[key] = conn.execute(
+                    'SELECT id FROM patients WHERE name = ? AND gender_id = ? AND blood_type_id = ?', key
+                ).fetchone()[0]
         
-        return dict(user) if user else None
+        if conn.in_transaction:
+            conn.commit()
+        if new_values:
+            self.vocab_cache = vocab
+        for key in new_patients:
+            self.patient_cache.set(key, patients[key])
+        
+        age, risk_level = _COLUMN['age'], _COLUMN['risk_level']
+        return list(zip(
+            columns[_COLUMN['user_id']],
+            map(patients.__getitem__, patient_keys),
+            *columns[age:age + 3],  # age, room_number, billing_amount
+            *(codes[field] for field in PREDICTION_CODED_FIELDS),
+            *columns[risk_level:]  # risk_level, model_version[, created_at]
+        ))
     
-    def save_prediction(self, user_id, patient_data, risk_level):
+    @instrumented('save_prediction')
+    def save_prediction(self, user_id, patient_data, risk_level, model_version=None):
         """Save a prediction to database"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO predictions (
-                    user_id, patient_name, age, room_number, billing_amount,
-                    gender, blood_type, medical_condition, admission_type,
-                    medication, insurance_provider, risk_level
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                patient_data.get('patient_name', 'Unknown'),
-                patient_data['age'],
-                patient_data['room_number'],
-                patient_data['billing_amount'],
-                patient_data.get('gender'),
-                patient_data.get('blood_type'),
-                patient_data.get('medical_condition'),
-                patient_data.get('admission_type'),
-                patient_data.get('medication'),
-                patient_data.get('insurance_provider'),
-                risk_level
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self.connection() as conn:
+                row = self.prediction_row(user_id, patient_data, risk_level, model_version)
+                conn.execute(INSERT_PREDICTION_SQL, self.encode_predictions(conn, [row])[0])
+                conn.commit()
             return True
         except Exception as e:
+            DB_ERRORS.labels(operation='save_prediction').inc()
             print(f"Error saving prediction: {e}")
             return False
     
-    def get_predictions(self, user_id=None, limit=50):
-        """Get predictions, optionally filtered by user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    @instrumented('save_predictions')
+    def save_predictions(self, user_id, patients, risk_levels, model_version=None):
+        """Save a batch of predictions in a single transaction"""
+        rows = [self.prediction_row(user_id, patient_data, risk_level, model_version)
+                for patient_data, risk_level in zip(patients, risk_levels)]
+        try:
+            with self.connection() as conn:
+                conn.executemany(INSERT_PREDICTION_SQL, self.encode_predictions(conn, rows))
+                conn.commit()
+            return True
+        except Exception as e:
+            DB_ERRORS.labels(operation='save_predictions').inc()
+            print(f"Error saving batch of {len(rows)} predictions: {e}")
+            return False
+    
+    @instrumented('bulk_insert_predictions')
+    def bulk_insert_predictions(self, rows):
+        """Insert rows of PREDICTION_COLUMNS values plus created_at in one transaction.
         
-        if user_id:
-            cursor.execute('''
-                SELECT p.*, u.full_name as user_name
-                FROM predictions p
-                JOIN users u ON p.user_id = u.id
-                WHERE p.user_id = ?
-                ORDER BY p.created_at DESC
-                LIMIT ?
-            ''', (user_id, limit))
-        else:
-            cursor.execute('''
-                SELECT p.*, u.full_name as user_name
-                FROM predictions p
-                JOIN users u ON p.user_id = u.id
-                ORDER BY p.created_at DESC
+        Unlike save_predictions this raises on failure, for loaders that need to stop.
+        """
+        with self.connection() as conn:
+            conn.executemany(BULK_INSERT_PREDICTION_SQL, self.encode_predictions(conn, rows))
+            conn.commit()
+    
+    @instrumented('commit_journal_batch')
+    def commit_journal_batch(self, journal, rows, last_seq):
+        """Insert journaled prediction rows (PREDICTION_COLUMNS + created_at) and
+        advance the journal's checkpoint in the same transaction, so a replay
+        after a crash never inserts a row twice. Raises on failure."""
+        with self.connection() as conn:
+            conn.executemany(BULK_INSERT_PREDICTION_SQL, self.encode_predictions(conn, rows))
+            conn.execute('''
+                INSERT INTO journal_checkpoints (journal, last_seq) VALUES (?, ?)
+                ON CONFLICT (journal) DO UPDATE SET last_seq = excluded.last_seq
+            ''', (journal, last_seq))
+            conn.commit()
+    
+    def journal_checkpoint(self, journal):
+        """Sequence number of the last journal entry committed (0 if none)"""
+        with self.connection() as conn:
+            row = conn.execute('SELECT last_seq FROM journal_checkpoints WHERE journal = ?',
+                               (journal,)).fetchone()
+        return row['last_seq'] if row else 0
+    
+    def delete_journal_checkpoint(self, journal):
+        """Forget a journal that has been fully committed and removed"""
+        with self.connection() as conn:
+            conn.execute('DELETE FROM journal_checkpoints WHERE journal = ?', (journal,))
+            conn.commit()
+    
+    @instrumented('bulk_create_users')
+    def bulk_create_users(self, users, password_hash):
+        """Insert (username, email, role, full_name) rows sharing one precomputed
+        password hash, skipping usernames or emails that already exist"""
+        with self.connection() as conn:
+            before = conn.total_changes
+            conn.executemany('''
+                INSERT OR IGNORE INTO users (username, email, password_hash, role, full_name)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(username, email, password_hash, role, full_name)
+                  for username, email, role, full_name in users])
+            conn.commit()
+            inserted = conn.total_changes - before
+        self.user_cache.clear()
+        return inserted
+    
+    @instrumented('get_predictions')
+    def get_predictions(self, user_id=None, limit=50, before=None, after=None, **filters):
+        """Get predictions newest first, optionally filtered by user.
+        
+        Pages by keyset: `before`/`after` are (created_at, id) cursors and
+        select rows older/newer than that position, so every page is an
+        index range seek. Extra filters: risk_level, date_from, date_to,
+        medical_condition.
+        """
+        clauses, params = prediction_filters(user_id, **filters)
+        order = 'DESC'
+        if before:
+            clauses.append('(p.created_at, p.id) < (?, ?)')
+            params.extend(before)
+        elif after:
+            clauses.append('(p.created_at, p.id) > (?, ?)')
+            params.extend(after)
+            order = 'ASC'
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT p.*
+                FROM {PREDICTION_DETAILS_VIEW} p
+                {where}
+                ORDER BY p.created_at {order}, p.id {order}
                 LIMIT ?
-            ''', (limit,))
+            ''', (*params, limit))
+            predictions = [dict(row) for row in cursor.fetchall()]
         
-        predictions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        if order == 'ASC':
+            predictions.reverse()
         return predictions
     
+    @instrumented('get_prediction_page')
+    def get_prediction_page(self, user_id=None, page_size=50, cursor=None, direction='next', **filters):
+        """One page of predictions plus opaque cursors for the neighbouring pages"""
+        position = decode_cursor(cursor)
+        backwards = position is not None and direction == 'prev'
+        
+        # One extra row tells us whether another page exists in the travel direction
+        rows = self.get_predictions(
+            user_id,
+            limit=page_size + 1,
+            before=position if not backwards else None,
+            after=position if backwards else None,
+            **filters
+        )
+        more = len(rows) > page_size
+        if backwards:
+            rows = rows[1:] if more else rows
+        else:
+            rows = rows[:page_size]
+        
+        has_next = more if not backwards else True
+        has_prev = more if backwards else position is not None
+        return {
+            'predictions': rows,
+            'next_cursor': encode_cursor(rows[-1]) if rows and has_next else None,
+            'prev_cursor': encode_cursor(rows[0]) if rows and has_prev else None
+        }
+    
+    def iter_prediction_batches(self, user_id=None, batch_size=5000, **filters):
+        """Stream predictions oldest first as lists of dicts, `batch_size` rows at a time.
+        
+        Rows are pulled lazily from one open cursor, so memory stays flat
+        however large the result is. The cursor gets its own read-only
+        connection outside the pool: a slow download must not hold a pooled
+        connection that every other request competes for.
+        """
+        clauses, params = prediction_filters(user_id, **filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        
+        conn = self.pool.connect()
+        try:
+            conn.execute('PRAGMA query_only = ON')
+            cursor = conn.execute(f'''
+                SELECT p.*
+                FROM {PREDICTION_DETAILS_VIEW} p
+                {where}
+                ORDER BY p.created_at, p.id
+            ''', params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+            cursor.close()
+        finally:
+            conn.close()
+    
+    @instrumented('search_predictions')
+    def search_predictions(self, query, user_id=None, page=1, page_size=20):
+        """Predictions matching every word of `query`, one page at a time.
+        
+        A word matches as a prefix of a word in the patient's name or in one
+        of the categorical fields (gender, blood type, medical condition,
+        admission type, medication, insurance provider). Results are ranked
+        by how well the name matched, then newest first; queries naming only
+        categories come back newest first. Returns the page of predictions
+        and whether another page follows.
+        """
+        terms = list(dict.fromkeys(search_terms(query)))[:MAX_SEARCH_TERMS]
+        page = max(page, 1)
+        empty = {'predictions': [], 'page': page, 'has_next': False}
+        if not terms:
+            return empty
+        
+        with self.connection() as conn:
+            vocab = conn.execute('SELECT id, field, value FROM vocab').fetchall()
+            
+            name_queries, clauses, params = [], [], []
+            for term in terms:
+                codes = {}
+                for vocab_id, field, value in vocab:
+                    if any(word.startswith(term) for word in search_terms(value)):
+                        codes.setdefault(field, []).append(str(vocab_id))
+                # Ids come from vocab, so inlining them is safe
+                options = [f"{'pt' if field in PATIENT_CODED_FIELDS else 'b'}.{field}_id IN ({', '.join(ids)})"
+                           for field, ids in codes.items()]
+                name_query = _name_query(term)
+                if not options:
+                    if name_query is None:
+                        return empty
+                    name_queries.append(name_query)
+                    continue
+                if name_query is not None:
+                    options.append(f'b.patient_id IN (SELECT rowid FROM {PATIENT_SEARCH_TABLE} '
+                                   f'WHERE {PATIENT_SEARCH_TABLE} MATCH ?)')
+                    params.append(name_query)
+                clauses.append(f"({' OR '.join(options)})")
+            if user_id:
+                clauses.append('b.user_id = ?')
+                params.append(user_id)
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+            
+            if name_queries:
+                # Start from the matching patients and walk their predictions
+                source = f'''(SELECT rowid AS patient_id, rank FROM {PATIENT_SEARCH_TABLE}
+                              WHERE {PATIENT_SEARCH_TABLE} MATCH ?) m
+                             JOIN predictions b ON b.patient_id = m.patient_id'''
+                rank = 'm.rank'
+                params.insert(0, ' '.join(name_queries))
+            else:
+                source, rank = 'predictions b', '0'
+            order = 'b.created_at DESC, b.id DESC' if rank == '0' else f'{rank}, b.created_at DESC, b.id DESC'
+            
+            # Page through bare ids first; only the rows shown are expanded through the view.
+            # One extra row tells us whether another page exists.
+            rows = conn.execute(f'''
+                SELECT p.*
+                FROM (
+                    SELECT b.id, {rank} AS rank, b.created_at
+                    FROM {source}
+                    JOIN patients pt ON pt.id = b.patient_id
+                    {where}
+                    ORDER BY {order}
+                    LIMIT ? OFFSET ?
+                ) hit
+                JOIN {PREDICTION_DETAILS_VIEW} p ON p.id = hit.id
+                ORDER BY hit.rank, hit.created_at DESC, hit.id DESC
+            ''', (*params, page_size + 1, (page - 1) * page_size)).fetchall()
+        
+        return {
+            'predictions': [dict(row) for row in rows[:page_size]],
+            'page': page,
+            'has_next': len(rows) > page_size
+        }
+    
+    @instrumented('get_statistics')
     def get_statistics(self, user_id=None):
         """Get statistics for dashboard"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if user_id:
-            # User-specific stats
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Doctors get the global row, everyone else their own (see risk_counts triggers)
             cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_predictions,
-                    SUM(CASE WHEN risk_level = 'Low Risk' THEN 1 ELSE 0 END) as low_risk,
-                    SUM(CASE WHEN risk_level = 'Medium Risk' THEN 1 ELSE 0 END) as medium_risk,
-                    SUM(CASE WHEN risk_level = 'High Risk' THEN 1 ELSE 0 END) as high_risk
-                FROM predictions
+                SELECT total_predictions, low_risk, medium_risk, high_risk
+                FROM risk_counts
                 WHERE user_id = ?
-            ''', (user_id,))
+            ''', (user_id or GLOBAL_STATS_ID,))
+            row = cursor.fetchone()
+        
+        if row is None:
+            return {'total_predictions': 0, 'low_risk': 0, 'medium_risk': 0, 'high_risk': 0}
+        return dict(row)
+    
+    @instrumented('rebuild_statistics')
+    def rebuild_statistics(self):
+        """Recompute risk_counts from the predictions table and the archived counts"""
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_risk_counts(conn)
+            add_archived_counts(conn)
+            conn.commit()
+    
+    @instrumented('verify_statistics')
+    def verify_statistics(self):
+        """Compare risk_counts with a full aggregate plus the archived counts;
+        returns the rows that differ"""
+        with self.connection() as conn:
+            expected = {GLOBAL_STATS_ID: tuple(conn.execute(
+                f'SELECT {RISK_COUNT_COLUMNS} FROM predictions').fetchone())}
+            for row in conn.execute(f'SELECT user_id, {RISK_COUNT_COLUMNS} FROM predictions GROUP BY user_id'):
+                expected[row[0]] = tuple(row)[1:]
+            for row in conn.execute(f'''
+                SELECT user_id, SUM(total_predictions), SUM(low_risk), SUM(medium_risk), SUM(high_risk)
+                FROM {ARCHIVED_ROLLUPS['risk_rollup_daily']}
+                GROUP BY user_id
+            '''):
+                live = expected.get(row[0], (0, 0, 0, 0))
+                expected[row[0]] = tuple(a + b for a, b in zip(live, tuple(row)[1:]))
+            stored = {row[0]: tuple(row)[1:] for row in conn.execute(
+                'SELECT user_id, total_predictions, low_risk, medium_risk, high_risk FROM risk_counts')}
+        
+        empty = (0, 0, 0, 0)
+        return [
+            {'user_id': user_id, 'expected': expected.get(user_id, empty), 'stored': stored.get(user_id, empty)}
+            for user_id in sorted(set(expected) | set(stored))
+            if expected.get(user_id, empty) != stored.get(user_id, empty)
+        ]
+    
+    @instrumented('get_data_version')
+    def get_data_version(self, user_id=None):
+        """(version, updated_at) of one user's predictions, or of everyone's without user_id.
+        
+        The version changes whenever a matching prediction is written or
+        removed; updated_at is a UTC 'YYYY-MM-DD HH:MM:SS' string or None.
+        """
+        with self.connection() as conn:
+            row = conn.execute('SELECT version, updated_at FROM data_versions WHERE user_id = ?',
+                               (user_id or GLOBAL_STATS_ID,)).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+    
+    @instrumented('get_risk_trends')
+    def get_risk_trends(self, granularity='day', group_by=None, user_id=None, date_from=None, date_to=None,
+                        medical_condition=None, admission_type=None):
+        """Risk counts per time bucket from the rollup tables, oldest first.
+        
+        granularity: 'hour', 'day' or 'week'; group_by: None, 'medical_condition',
+        'admission_type' or 'user'. Without user_id the counts cover everyone;
+        hourly trends exist only for everyone (ValueError otherwise).
+        Dates are inclusive YYYY-MM-DD strings. Returns dicts with bucket,
+        group (None when not grouped) and the four risk counts.
+        """
+        table, bucket = TREND_GRANULARITIES[granularity]
+        if (user_id or group_by == 'user') and not ROLLUP_BUCKETS[table][1]:
+            raise ValueError(f'{granularity} trends are only kept for all users together')
+        group_key, label, join = TREND_GROUPS[group_by] if group_by else ('NULL', 'NULL', '')
+        if group_by == 'user' and not user_id:
+            # Per-user rows, leaving out the everyone row
+            clauses, params = [f'r.user_id != {GLOBAL_STATS_ID}'], []
         else:
-            # Global stats
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_predictions,
-                    SUM(CASE WHEN risk_level = 'Low Risk' THEN 1 ELSE 0 END) as low_risk,
-                    SUM(CASE WHEN risk_level = 'Medium Risk' THEN 1 ELSE 0 END) as medium_risk,
-                    SUM(CASE WHEN risk_level = 'High Risk' THEN 1 ELSE 0 END) as high_risk
-                FROM predictions
-            ''')
+            clauses, params = ['r.user_id = ?'], [user_id or GLOBAL_STATS_ID]
+        if date_from:
+            clauses.append('r.bucket >= ?')
+            params.append(date_from)
+        if date_to:
+            clauses.append("r.bucket < date(?, '+1 day')")
+            params.append(date_to)
+        for field, value in (('medical_condition', medical_condition), ('admission_type', admission_type)):
+            if value:
+                clauses.append(f"r.{field}_id = COALESCE({_vocab_id_sql(field, '?')}, -1)")
+                params.append(value)
+        
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {bucket} AS bucket, {label} AS "group",
+                       SUM(r.total_predictions) AS total_predictions, SUM(r.low_risk) AS low_risk,
+                       SUM(r.medium_risk) AS medium_risk, SUM(r.high_risk) AS high_risk
+                FROM {table} r
+                {join}
+                WHERE {' AND '.join(clauses)}
+                GROUP BY 1, {group_key}
+                ORDER BY 1, 2
+            ''', params).fetchall()
+        return [dict(row) for row in rows]
+    
+    @instrumented('rebuild_trends')
+    def rebuild_trends(self):
+        """Backfill the trend rollup tables from the predictions table and the archived counts"""
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_risk_rollups(conn)
+            add_archived_rollups(conn)
+            conn.commit()
+    
+    @instrumented('rebuild_search')
+    def rebuild_search(self):
+        """Re-index all patients for search_predictions()"""
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(f"INSERT INTO {PATIENT_SEARCH_TABLE} ({PATIENT_SEARCH_TABLE}) VALUES ('rebuild')")
+            conn.commit()
+    
+    @instrumented('vacuum')
+    def vacuum(self):
+        """Rewrite the database file without free pages; returns (bytes before, bytes after)"""
+        with self.connection() as conn:
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            before = conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+            conn.execute('VACUUM')
+            after = conn.execute('PRAGMA page_count').fetchone()[0] * page_size
+        return before, after
+    
+    @instrumented('incremental_vacuum')
+    def incremental_vacuum(self):
+        """Return free pages to the filesystem without rewriting the file.
         
-        stats = dict(cursor.fetchone())
-        conn.close()
-        return stats
+        Returns the bytes released, or None when the file is not in
+        auto_vacuum=INCREMENTAL mode yet (a full vacuum() converts it).
+        """
+        with self.connection() as conn:
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                return None
+            page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+            free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            # Frees one page per step; executescript steps it to completion
+            conn.executescript('PRAGMA incremental_vacuum')
+            return (free - conn.execute('PRAGMA freelist_count').fetchone()[0]) * page_size
     
+    @instrumented('get_all_users')
     def get_all_users(self):
         """Get all users (for admin/doctor view)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        users = self.user_cache.get(('all',))
+        if users is None:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT id, username, email, role, full_name, created_at FROM users')
+                users = [dict(row) for row in cursor.fetchall()]
+            self.user_cache.set(('all',), users)
+        return [dict(user) for user in users]
+    
+    @instrumented('load_session')
+    def load_session(self, session_id):
+        """Serialized data of an unexpired session, or None"""
+        with self.connection() as conn:
+            row = conn.execute('''
+                SELECT data FROM sessions
+                WHERE id = ? AND expires_at > datetime('now')
+            ''', (session_id,)).fetchone()
+        return row['data'] if row else None
+    
+    @instrumented('save_session')
+    def save_session(self, session_id, user_id, data, expires_at):
+        """Create or replace a session; expires_at is a naive UTC datetime.
         
-        cursor.execute('SELECT id, username, email, role, full_name, created_at FROM users')
-        users = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return users
+        Expired sessions are swept along with a write at most every
+        SESSION_PURGE_INTERVAL seconds, so the table stays bounded without cron.
+        """
+        now = time.monotonic()
+        purge = now >= self._next_session_purge
+        if purge:
+            self._next_session_purge = now + SESSION_PURGE_INTERVAL
+        with self.connection() as conn:
+            conn.execute('''
+                INSERT INTO sessions (id, user_id, data, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    user_id = excluded.user_id, data = excluded.data, expires_at = excluded.expires_at
+            ''', (session_id, user_id, data, expires_at.strftime('%Y-%m-%d %H:%M:%S')))
+            if purge:
+                conn.execute("DELETE FROM sessions WHERE expires_at <= datetime('now')")
+            conn.commit()
+    
+    @instrumented('delete_session')
+    def delete_session(self, session_id):
+        """Remove one session"""
+        with self.connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+            conn.commit()
+    
+    @instrumented('revoke_sessions')
+    def revoke_sessions(self, user_id):
+        """Log a user out everywhere; returns the number of sessions ended"""
+        with self.connection() as conn:
+            deleted = conn.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,)).rowcount
+            conn.commit()
+        self.invalidate_user(user_id=user_id)
+        return deleted
+    
+    @instrumented('purge_expired_sessions')
+    def purge_expired_sessions(self):
+        """Delete expired sessions; returns how many were removed"""
+        with self.connection() as conn:
+            deleted = conn.execute("DELETE FROM sessions WHERE expires_at <= datetime('now')").rowcount
+            conn.commit()
+        return deleted
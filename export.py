@@ -0,0 +1,128 @@
+"""
+Streaming export of prediction history to CSV and Parquet
+Rows arrive in batches from Database.iter_prediction_batches and leave as
+chunks, so memory use does not depend on how many rows are exported.
+"""
+
+import csv
+import io
+
+EXPORT_COLUMNS = [
+    'id', 'created_at', 'user_id', 'user_name', 'patient_name', 'age', 'gender',
+    'blood_type', 'medical_condition', 'admission_type', 'medication',
+    'insurance_provider', 'room_number', 'billing_amount', 'risk_level', 'model_version'
+]
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+
+def iter_csv(batches, columns=EXPORT_COLUMNS):
+    """Yield CSV text, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the caller"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Parquet export requires pyarrow: pip install pyarrow')
+    return pyarrow, pyarrow.parquet
+
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ('id', pa.int64()),
+        ('created_at', pa.string()),
+        ('user_id', pa.int64()),
+        ('user_name', pa.string()),
+        ('patient_name', pa.string()),
+        ('age', pa.int64()),
+        ('gender', pa.string()),
+        ('blood_type', pa.string()),
+        ('medical_condition', pa.string()),
+        ('admission_type', pa.string()),
+        ('medication', pa.string()),
+        ('insurance_provider', pa.string()),
+        ('room_number', pa.int64()),
+        ('billing_amount', pa.float64()),
+        ('risk_level', pa.string()),
+        ('model_version', pa.string())
+    ])
+
+
+def iter_parquet(batches):
+    """Yield a Parquet file as bytes, writing one row group per batch"""
+    pa, pq = _require_pyarrow()
+    schema = _parquet_schema(pa)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for batch in batches:
+            columns = {name: [row.get(name) for row in batch] for name in schema.names}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def iter_export(batches, fmt):
+    """Chunks for the requested export format.
+
+    Raises ValueError for an unknown format and RuntimeError when Parquet
+    is requested without pyarrow installed, before any rows are read.
+    """
+    if fmt == 'csv':
+        return iter_csv(batches)
+    if fmt == 'parquet':
+        _require_pyarrow()
+        return iter_parquet(batches)
+    raise ValueError(f'Unknown export format: {fmt}')
+
+
+def write_export(batches, fmt, path):
+    """Stream an export to a file"""
+    chunks = iter_export(batches, fmt)
+    if fmt == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.writelines(chunks)
+    else:
+        with open(path, 'wb') as f:
+            f.writelines(chunks)
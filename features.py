@@ -0,0 +1,97 @@
+"""
+Compiled feature pipeline for the full patient record
+Turns patient fields into a dense row in feature_columns.pkl order: numeric
+values copied through, categoricals one-hot encoded through precomputed
+category -> column index tables built once from encoder.pkl, instead of
+running pd.get_dummies or OneHotEncoder.transform per request. Unknown
+categories encode as all zeros, like the encoder's handle_unknown='ignore'.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Dataset column -> patient field name used by the app and database
+NUMERIC_FIELDS = {
+    'Age': 'age',
+    'Billing Amount': 'billing_amount',
+    'Room Number': 'room_number'
+}
+CATEGORICAL_FIELDS = {
+    'Gender': 'gender',
+    'Blood Type': 'blood_type',
+    'Medical Condition': 'medical_condition',
+    'Admission Type': 'admission_type',
+    'Medication': 'medication',
+    'Insurance Provider': 'insurance_provider'
+}
+
+
+class FeaturePipeline:
+    """Encodes patients into rows matching a fixed feature column list"""
+
+    def __init__(self, feature_columns, encoder=None):
+        self.columns = list(feature_columns)
+        positions = {name: i for i, name in enumerate(self.columns)}
+        if len(positions) != len(self.columns):
+            raise ValueError('Duplicate names in feature columns')
+
+        # (output position, patient field) for numeric columns present in the layout
+        self.numeric = [(positions[column], field) for column, field in NUMERIC_FIELDS.items()
+                        if column in positions]
+
+        # Category vocabularies come from the fitted encoder when available,
+        # otherwise from the get_dummies-style "<column>_<value>" names
+        if encoder is not None:
+            vocab = {column: [str(value) for value in categories]
+                     for column, categories in zip(encoder.feature_names_in_, encoder.categories_)}
+        else:
+            vocab = {column: [name[len(column) + 1:] for name in self.columns if name.startswith(column + '_')]
+                     for column in CATEGORICAL_FIELDS}
+
+        # field -> (categories, output position per category, {category: position})
+        self.categorical = {}
+        for column, field in CATEGORICAL_FIELDS.items():
+            categories = [value for value in vocab.get(column, []) if f'{column}_{value}' in positions]
+            if not categories:
+                continue
+            index = np.array([positions[f'{column}_{value}'] for value in categories], dtype=np.intp)
+            self.categorical[field] = (categories, index, dict(zip(categories, index.tolist())))
+
+        unused = set(range(len(self.columns))) - {pos for pos, _ in self.numeric}
+        for _, index, _ in self.categorical.values():
+            unused -= set(index.tolist())
+        if unused:
+            missing = ', '.join(self.columns[i] for i in sorted(unused))
+            raise ValueError(f'No encoding for feature columns: {missing}')
+
+    @property
+    def width(self):
+        return len(self.columns)
+
+    def transform_one(self, patient):
+        """Dense float64 row for one patient dict (field names as in the predict form)"""
+        row = np.zeros(len(self.columns))
+        for position, field in self.numeric:
+            row[position] = float(patient[field])
+        for field, (_, _, lookup) in self.categorical.items():
+            position = lookup.get(patient.get(field))
+            if position is not None:
+                row[position] = 1.0
+        return row
+
+    def transform_many(self, patients):
+        """(n, width) float64 matrix for a DataFrame (or dict of columns / list of dicts)"""
+        if not isinstance(patients, pd.DataFrame):
+            patients = pd.DataFrame(patients)
+        n = len(patients)
+        out = np.zeros((n, len(self.columns)))
+        for position, field in self.numeric:
+            out[:, position] = patients[field].to_numpy(dtype=np.float64)
+        rows = np.arange(n)
+        for field, (categories, index, _) in self.categorical.items():
+            if field not in patients:
+                continue
+            codes = pd.Categorical(patients[field], categories=categories).codes
+            known = codes >= 0
+            out[rows[known], index[codes[known]]] = 1.0
+        return out
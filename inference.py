@@ -0,0 +1,97 @@
+"""
+NumPy inference engine for the PCA + KMeans risk model
+Scores patients without building DataFrames or going through sklearn's input validation;
+the one check that matters, finite inputs, is done here
+"""
+
+import threading
+import numpy as np
+
+# Cluster id -> risk label
+RISK_LABELS = np.array(["Low Risk", "Medium Risk", "High Risk"], dtype=object)
+MODEL_FEATURES = ["Age", "Billing Amount", "Room Number"]
+
+
+class RiskEngine:
+    """Scores patients with the fitted PCA/KMeans parameters as plain NumPy arrays"""
+
+    def __init__(self, pca_model, kmeans_model, labels=RISK_LABELS):
+        features = getattr(pca_model, 'feature_names_in_', None)
+        self.features = list(features) if features is not None else list(MODEL_FEATURES)
+        self.labels = np.asarray(labels, dtype=object)
+
+        # Same operation order as PCA.transform: X @ components.T - mean @ components.T
+        components = np.asarray(pca_model.components_, dtype=np.float64)
+        self.components_t = np.ascontiguousarray(components.T)
+        self.offset = np.asarray(pca_model.mean_, dtype=np.float64).reshape(1, -1) @ components.T
+        # Beyond this |coordinate| the squared distances overflow and argmin is meaningless
+        self.max_projection = np.sqrt(np.finfo(np.float64).max / components.shape[0]) / 2
+        self.scale = None
+        if pca_model.whiten:
+            self.scale = np.sqrt(np.clip(pca_model.explained_variance_, np.finfo(np.float64).eps, None))
+
+        # KMeans assigns argmin(||c||^2 - 2 x.c); ||x||^2 is constant per row
+        centers = np.asarray(kmeans_model.cluster_centers_, dtype=np.float64)
+        self.centers_t = np.ascontiguousarray(centers.T)
+        self.center_sq = (centers * centers).sum(axis=1)
+
+        self._local = threading.local()
+
+    def _buffers(self):
+        """Per-thread preallocated buffers for single-row scoring"""
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = (
+                np.empty((1, self.components_t.shape[0])),
+                np.empty((1, self.components_t.shape[1])),
+                np.empty((1, self.centers_t.shape[1]))
+            )
+            self._local.buffers = buffers
+        return buffers
+
+    def _assign(self, X, projected, distances):
+        """Project X and return the index of the nearest centroid for each row.
+
+        Raises ValueError for NaN or infinite inputs, and for values so large
+        their distances overflow (argmin would still pick a cluster for them).
+        """
+        np.matmul(X, self.components_t, out=projected)
+        projected -= self.offset
+        if self.scale is not None:
+            projected /= self.scale
+        # One comparison also catches NaN and infinite inputs (they project to NaN or inf)
+        if not (np.abs(projected) < self.max_projection).all():
+            if not np.isfinite(X).all(axis=1).all():
+                raise ValueError('Age, billing amount and room number must be finite numbers')
+            raise ValueError('Age, billing amount and room number are out of range')
+        np.matmul(projected, self.centers_t, out=distances)
+        distances *= -2.0
+        distances += self.center_sq
+        return distances.argmin(axis=1)
+
+    def vectorize(self, age, billing_amount, room_number):
+        """Order the numeric inputs the way the models were fitted"""
+        values = {"Age": age, "Billing Amount": billing_amount, "Room Number": room_number}
+        return [values[name] for name in self.features]
+
+    def predict_cluster(self, age, billing_amount, room_number):
+        """Cluster id for a single patient"""
+        X, projected, distances = self._buffers()
+        X[0] = self.vectorize(age, billing_amount, room_number)
+        return int(self._assign(X, projected, distances)[0])
+
+    def predict_one(self, age, billing_amount, room_number):
+        """Risk label for a single patient"""
+        return self.labels[self.predict_cluster(age, billing_amount, room_number)]
+
+    def predict_clusters(self, age, billing_amount, room_number):
+        """Cluster ids for arrays of patients"""
+        columns = self.vectorize(age, billing_amount, room_number)
+        X = np.column_stack([np.asarray(column, dtype=np.float64) for column in columns])
+        projected = np.empty((X.shape[0], self.components_t.shape[1]))
+        distances = np.empty((X.shape[0], self.centers_t.shape[1]))
+        return self._assign(X, projected, distances)
+
+    def predict_many(self, age, billing_amount, room_number):
+        """Risk labels for arrays of patients"""
+        return self.labels[self.predict_clusters(age, billing_amount, room_number)]
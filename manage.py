@@ -0,0 +1,275 @@
+"""
+Maintenance commands for the Healthcare Risk Prediction System
+
+Usage:
+    python manage.py migrate
+    python manage.py check-plans
+    python manage.py rebuild-stats
+    python manage.py verify-stats
+    python manage.py rebuild-trends
+    python manage.py rebuild-search
+    python manage.py vacuum
+    python manage.py archive [--days N] [--dry-run]
+    python manage.py archive-list
+    python manage.py export --format csv --output predictions.csv [--user-id N] [--archived]
+    python manage.py models-list
+    python manage.py models-publish --from DIR [--version NAME] [--activate]
+    python manage.py models-activate NAME
+    python manage.py models-validate --data held_out.csv [--version NAME]
+    python manage.py sessions-revoke USERNAME
+    python manage.py sessions-purge
+"""
+
+import argparse
+import sys
+
+from config import get_config
+from database import Database
+from export import write_export, FORMATS as EXPORT_FORMATS
+from model_registry import ModelRegistry
+from retention import RetentionError, archive_predictions, archive_summary, iter_archived_batches, retention_cutoff
+
+
+def model_registry(args):
+    config = get_config()
+    return ModelRegistry(args.models_dir or config.model_dir, legacy_dir=config.legacy_model_dir)
+
+
+def cmd_migrate(db, args):
+    """Upgrade the database schema in place"""
+    # Database() already applies pending migrations on open
+    print(f"Schema version: {db.schema_version()}")
+
+
+def cmd_check_plans(db, args):
+    """Show query plans for the hot dashboard/history queries"""
+    failures = 0
+    for name, (ok, plan) in db.check_query_plans().items():
+        print(f"{'✓' if ok else '✗'} {name}")
+        for detail in plan:
+            print(f"    {detail}")
+        failures += not ok
+    return 1 if failures else 0
+
+
+def cmd_rebuild_stats(db, args):
+    """Recompute the dashboard risk-count summary table"""
+    db.rebuild_statistics()
+    print(f"Risk counts rebuilt: {db.get_statistics()}")
+
+
+def cmd_verify_stats(db, args):
+    """Check the risk-count summary table against the predictions table"""
+    mismatches = db.verify_statistics()
+    for mismatch in mismatches:
+        print(f"✗ user {mismatch['user_id']}: expected {mismatch['expected']}, stored {mismatch['stored']}")
+    if mismatches:
+        print("Run `python manage.py rebuild-stats` to repair")
+        return 1
+    print("✓ Risk counts match predictions")
+    return 0
+
+
+def cmd_rebuild_trends(db, args):
+    """Backfill the hourly/daily risk trend rollups from the predictions table"""
+    db.rebuild_trends()
+    print("Risk trend rollups rebuilt")
+
+
+def cmd_rebuild_search(db, args):
+    """Re-index patient names for /search"""
+    db.rebuild_search()
+    print("Patient search index rebuilt")
+
+
+def cmd_vacuum(db, args):
+    """Compact the database file (e.g. after the schema 6 migration)"""
+    before, after = db.vacuum()
+    print(f"Database file: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+
+
+def cmd_archive(db, args):
+    """Move predictions older than the retention window into monthly archive files"""
+    config = get_config()
+    days = config.retention_days if args.days is None else args.days
+    if days <= 0:
+        print("No retention window: set retention_days in the config or pass --days")
+        return 1
+    archive_dir = args.archive_dir or config.archive_dir
+    cutoff = retention_cutoff(db, days)
+    
+    def progress(month, rows):
+        print(f"  {month}: {rows} rows moved")
+    try:
+        months = archive_predictions(db, cutoff, archive_dir, batch_size=args.batch_size,
+                                     dry_run=args.dry_run, progress=progress)
+    except RetentionError as e:
+        print(f"Archiving stopped: {e}")
+        return 1
+    
+    total = sum(months.values())
+    if args.dry_run:
+        for month, rows in months.items():
+            print(f"  {month}: {rows} rows")
+        print(f"Dry run: {total} predictions before {cutoff} would move to {archive_dir}")
+        return 0
+    print(f"Archived and verified {total} predictions before {cutoff} into {archive_dir}")
+    if total:
+        released = db.incremental_vacuum()
+        if released is None:
+            print("Run `python manage.py vacuum` once to enable incremental vacuuming of the freed space")
+        else:
+            print(f"Released {released / 1e6:.1f} MB to the filesystem")
+
+
+def cmd_archive_list(db, args):
+    """List archive files with their row counts and date ranges"""
+    archives = archive_summary(args.archive_dir or get_config().archive_dir)
+    for archive in archives:
+        print(f"{archive['month']}  {archive['rows']:>9} rows  {archive['first']} .. {archive['last']}  "
+              f"{archive['bytes'] / 1e6:.1f} MB  {archive['path']}")
+    print(f"{len(archives)} archives, {sum(a['rows'] for a in archives)} predictions")
+
+
+def cmd_export(db, args):
+    """Stream prediction history to a CSV or Parquet file"""
+    user_id = None
+    if args.user_id is not None:
+        user = db.get_user_by_id(args.user_id)
+        if user is None:
+            print(f"No user with id {args.user_id}")
+            return 1
+        # Doctors export everything, other roles only their own records
+        user_id = None if user['role'] == 'Doctor' else user['id']
+    
+    filters = {name: getattr(args, name) for name in ('risk_level', 'medical_condition', 'date_from', 'date_to')
+               if getattr(args, name)}
+    output = args.output or f"predictions.{EXPORT_FORMATS[args.format][1]}"
+    if args.archived:
+        archive_dir = args.archive_dir or get_config().archive_dir
+        batches = iter_archived_batches(archive_dir, user_id, batch_size=args.batch_size, **filters)
+    else:
+        batches = db.iter_prediction_batches(user_id, batch_size=args.batch_size, **filters)
+    write_export(batches, args.format, output)
+    print(f"Exported predictions to {output}")
+
+
+def cmd_models_list(db, args):
+    """List published model versions"""
+    registry = model_registry(args)
+    active = registry.active_version()
+    for manifest in registry.versions():
+        marker = '*' if manifest['version'] == active else ' '
+        print(f"{marker} {manifest['version']}  {manifest['created_at']}  {', '.join(manifest['artifacts'])}")
+    if active == 'legacy':
+        print("* legacy  (pickles in the project root)")
+
+
+def cmd_models_publish(db, args):
+    """Publish trained model artifacts as a new version"""
+    registry = model_registry(args)
+    manifest = registry.publish(args.source, version=args.version, activate=args.activate)
+    print(f"Published model version {manifest['version']}" + (" (active)" if args.activate else ""))
+
+
+def cmd_models_activate(db, args):
+    """Switch running workers to a published model version"""
+    model_registry(args).activate(args.version)
+    print(f"Activated model version {args.version}")
+
+
+def cmd_models_validate(db, args):
+    """Report how often a model version agrees with the rule-based risk labels"""
+    from train_models import validate, print_report
+    registry = model_registry(args)
+    version = args.version or registry.active_version()
+    report = validate(registry.load(version).engine, args.data, args.chunksize, args.holdout, args.seed)
+    print(f"Model version {version}")
+    print_report(report)
+    return 0 if report['rows'] else 1
+
+
+def cmd_sessions_revoke(db, args):
+    """Log a user out of every session"""
+    user = db.get_user_by_username(args.username)
+    if user is None:
+        print(f"✗ No such user: {args.username}")
+        return 1
+    print(f"Revoked {db.revoke_sessions(user['id'])} session(s) for {args.username}")
+    return 0
+
+
+def cmd_sessions_purge(db, args):
+    """Delete expired login sessions"""
+    print(f"Purged {db.purge_expired_sessions()} expired session(s)")
+
+
+COMMANDS = {
+    'migrate': cmd_migrate,
+    'check-plans': cmd_check_plans,
+    'rebuild-stats': cmd_rebuild_stats,
+    'verify-stats': cmd_verify_stats,
+    'rebuild-trends': cmd_rebuild_trends,
+    'rebuild-search': cmd_rebuild_search,
+    'vacuum': cmd_vacuum,
+    'archive': cmd_archive,
+    'archive-list': cmd_archive_list,
+    'export': cmd_export,
+    'models-list': cmd_models_list,
+    'models-publish': cmd_models_publish,
+    'models-activate': cmd_models_activate,
+    'models-validate': cmd_models_validate,
+    'sessions-revoke': cmd_sessions_revoke,
+    'sessions-purge': cmd_sessions_purge
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Healthcare Risk Prediction maintenance commands")
+    parser.add_argument('--db', help='SQLite database file (default: db_path from the config)')
+    parser.add_argument('--models-dir', help='Model registry directory (default: model_dir from the config)')
+    parser.add_argument('--archive-dir', help='Prediction archive directory (default: archive_dir from the config)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    parsers = {name: subparsers.add_parser(name, help=func.__doc__) for name, func in COMMANDS.items()}
+    
+    export_parser = parsers['export']
+    export_parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+    export_parser.add_argument('--output', help='Output file (default: predictions.<format>)')
+    export_parser.add_argument('--user-id', type=int, help='Export as this user (doctors get every record)')
+    export_parser.add_argument('--batch-size', type=int, default=5000)
+    export_parser.add_argument('--risk-level')
+    export_parser.add_argument('--medical-condition')
+    export_parser.add_argument('--date-from', help='YYYY-MM-DD')
+    export_parser.add_argument('--date-to', help='YYYY-MM-DD')
+    export_parser.add_argument('--archived', action='store_true', help='Export from the archive files instead')
+    
+    archive_parser = parsers['archive']
+    archive_parser.add_argument('--days', type=int, help='Retention window (default: retention_days from the config)')
+    archive_parser.add_argument('--dry-run', action='store_true', help='Only report what would move')
+    archive_parser.add_argument('--batch-size', type=int, default=5000)
+    
+    parsers['models-publish'].add_argument('--from', dest='source', default='.',
+                                           help='Directory holding the trained .pkl files')
+    parsers['models-publish'].add_argument('--version', help='Version name (default: timestamp)')
+    parsers['models-publish'].add_argument('--activate', action='store_true')
+    parsers['models-activate'].add_argument('version')
+    validate_parser = parsers['models-validate']
+    validate_parser.add_argument('--data', required=True, help='CSV in the healthcare_dataset.csv layout')
+    validate_parser.add_argument('--version', help='Model version (default: the active one)')
+    validate_parser.add_argument('--chunksize', type=int, default=50000)
+    validate_parser.add_argument('--holdout', type=float, default=0.0,
+                                 help='Score only the rows train_models.py held out with this fraction')
+    validate_parser.add_argument('--seed', type=int, default=42, help='Seed used for the training hold-out')
+    parsers['sessions-revoke'].add_argument('username')
+    
+    args = parser.parse_args(argv)
+    
+    db = Database(args.db)
+    try:
+        return COMMANDS[args.command](db, args) or 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+In-process request and database metrics in the Prometheus text format
+Counters and latency histograms are plain Python objects guarded by a lock,
+so recording a sample costs a perf_counter() call and a few additions.
+
+Under serve.py every worker process keeps its own values; SnapshotDir has each
+one write them to a shared directory so whichever worker answers /metrics can
+report the sum over all of them.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import fcntl
+except ImportError:  # no fork, so only ever one process to report
+    fcntl = None
+
+# Latency buckets in seconds, from sub-millisecond NumPy scoring up to slow exports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Seconds between a worker's snapshots; other workers' values in /metrics lag by up to this
+SNAPSHOT_INTERVAL = 1.0
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Collection of metrics rendered together by /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f'Metric {metric.name} is already registered')
+            self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """{metric name: [[label values, state], ...]} of every series, JSON-serializable"""
+        with self._lock:
+            metrics = list(self._metrics)
+        return {metric.name: [[list(key), state] for key, state in metric.states()] for metric in metrics}
+
+    def reset(self):
+        """Zero every series in place (a forked worker starts from its parent's values)"""
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            metric.reset()
+
+    def render(self, snapshots=(), own=True):
+        """All metrics in the Prometheus text exposition format.
+
+        Series from `snapshots` (snapshot() results, e.g. from other processes)
+        are added to this process's own, or replace them with own=False.
+        """
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            series = dict(metric.states()) if own else {}
+            for snapshot in snapshots:
+                for key, state in snapshot.get(metric.name, ()):
+                    key = tuple(key)
+                    series[key] = metric.merge(series[key], state) if key in series else state
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples(sorted(series.items())))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values, **kwargs):
+        """The child series for one combination of label values"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _series(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+    def states(self):
+        """(label values, state) of each series; state is what merge() and samples() take"""
+        return [(key, child.state()) for key, child in self._series()]
+
+    def reset(self):
+        for _, child in self._series():
+            child.reset()
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def state(self):
+        return self.value
+
+    def reset(self):
+        with self._lock:
+            self.value = 0
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, e.g. requests served"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, series=None):
+        for key, value in self.states() if series is None else series:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.counts):
+                self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def state(self):
+        with self._lock:
+            return [list(self.counts), self.sum, self.count]
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * len(self.buckets)
+            self.sum = 0.0
+            self.count = 0
+
+
+class Histogram(_Metric):
+    """Distribution of observed values (latencies in seconds) over fixed buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self, *values, **kwargs):
+        """Context manager recording the duration of a with-block"""
+        return self.labels(*values, **kwargs).time()
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def samples(self, series=None):
+        for key, (counts, total, count) in self.states() if series is None else series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, key, [('le', '+Inf')])
+            yield f'{self.name}_bucket{labels} {count}'
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+def timed(histogram, errors=None, **labels):
+    """Decorator recording each call's duration in `histogram`.
+
+    If an `errors` counter is given it is incremented (with the same labels)
+    when the call raises.
+    """
+    def decorator(f):
+        series = histogram.labels(**labels)
+        error_series = errors.labels(**labels) if errors is not None else None
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            except Exception:
+                if error_series is not None:
+                    error_series.inc()
+                raise
+            finally:
+                series.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class SnapshotDir:
+    """Per-process metric snapshots in a directory shared by forked workers.
+
+    Each worker writes <pid>.json every `interval` seconds, on stop() and
+    before answering a scrape; render() sums every file. Reporting only what
+    is on disk means two scrapes answered by different workers never see a
+    counter go backwards. When the parent reaps a worker, retire() folds its
+    last snapshot into retired.json.
+    """
+
+    RETIRED = 'retired'
+
+    def __init__(self, path, registry=REGISTRY, interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        # Snapshot and replace together, so an older snapshot never overwrites a newer one
+        self._write_lock = threading.Lock()
+
+    def _file(self, name):
+        return os.path.join(self.path, f'{name}.json')
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """Readers share the lock; retire() takes it alone to move a file's counts"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, '.lock'), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write(self, name, snapshot):
+        # Readers see the old file or the new one, never half of one
+        temporary = os.path.join(self.path, f'.{name}.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(temporary, self._file(name))
+
+    def write(self):
+        """Record this process's current values"""
+        with self._write_lock:
+            self._write(os.getpid(), self.registry.snapshot())
+
+    def start(self):
+        """In a freshly forked worker: drop the values inherited from the parent and
+        snapshot in the background until stop()"""
+        self.registry.reset()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-snapshot', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        """Stop the background snapshots and write a final one"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.write()
+
+    def retire(self, pid):
+        """Fold an exited process's last snapshot into the retired totals"""
+        with self._locked(exclusive=True):
+            snapshot = self._read(self._file(pid))
+            if snapshot:
+                retired = self._read(self._file(self.RETIRED))
+                self._write(self.RETIRED, _merge_snapshots(self.registry, retired, snapshot))
+            try:
+                os.unlink(self._file(pid))
+            except FileNotFoundError:
+                pass
+
+    def render(self):
+        """Prometheus text summed over every process's snapshot, this one's refreshed first"""
+        self.write()
+        with self._locked(exclusive=False):
+            snapshots = [self._read(os.path.join(self.path, name)) for name in sorted(os.listdir(self.path))
+                         if name.endswith('.json')]
+        return self.registry.render(snapshots, own=False)
+
+
+def _merge_snapshots(registry, a, b):
+    """Series-wise sum of two snapshot() results"""
+    kinds = {metric.name: metric for metric in registry._metrics}
+    merged = {}
+    for name in set(a) | set(b):
+        series = {tuple(key): state for key, state in a.get(name, ())}
+        for key, state in b.get(name, ()):
+            key = tuple(key)
+            series[key] = kinds[name].merge(series[key], state) if key in series and name in kinds else state
+        merged[name] = [[list(key), state] for key, state in series.items()]
+    return merged
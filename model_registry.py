@@ -0,0 +1,246 @@
+"""
+Versioned model registry with hot reload
+Each version lives in models/<version>/ next to a manifest; the ACTIVE file
+names the version workers should serve. Workers notice a changed ACTIVE
+file on their next request and swap bundles without dropping requests.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import joblib
+
+from cache import LRUCache
+from features import FeaturePipeline
+from inference import RiskEngine, RISK_LABELS
+from metrics import Counter
+
+REQUIRED_ARTIFACTS = ('pca_model.pkl', 'kmeans_model.pkl')
+OPTIONAL_ARTIFACTS = ('encoder.pkl', 'feature_columns.pkl', 'risk_labels.pkl')
+MANIFEST_FILE = 'manifest.json'
+ACTIVE_FILE = 'ACTIVE'
+
+# Version name for the pickles in the project root, served until a version is published
+LEGACY_VERSION = 'legacy'
+
+# Memoized single-patient results; the risk label depends only on the model and three numbers
+PREDICTION_CACHE_SIZE = 10000
+PREDICTION_CACHE = Counter('hrp_prediction_cache_total', 'Single-patient prediction cache lookups', ['result'])
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ModelBundle:
+    """One loaded model version; never mutated after construction"""
+
+    def __init__(self, version, path, pca_model, kmeans_model, encoder=None, feature_columns=None,
+                 risk_labels=None):
+        self.version = version
+        self.path = path
+        self.pca_model = pca_model
+        self.kmeans_model = kmeans_model
+        self.encoder = encoder
+        self.feature_columns = feature_columns
+        # Cluster id -> label calibrated at training time; older versions use the fixed order
+        self.risk_labels = RISK_LABELS if risk_labels is None else risk_labels
+        if len(self.risk_labels) != len(kmeans_model.cluster_centers_):
+            raise ValueError(f'Model version {version} has {len(kmeans_model.cluster_centers_)} clusters '
+                             f'but {len(self.risk_labels)} risk labels')
+        self.engine = RiskEngine(pca_model, kmeans_model, self.risk_labels)
+        # Full-record encoder (numeric + one-hot categoricals) when the version ships a column list.
+        # Scoring doesn't use it, so a mismatched encoder/column list is logged rather than
+        # making the version unloadable; publish() rejects one up front.
+        self.features = None
+        self.features_error = None
+        if feature_columns is not None:
+            try:
+                self.features = FeaturePipeline(feature_columns, encoder)
+            except ValueError as e:
+                self.features_error = str(e)
+                print(f"Model version {version}: feature pipeline unavailable: {e}")
+        self.loaded_at = datetime.now()
+
+
+class ModelRegistry:
+    """Loads, publishes and hot-swaps versioned model artifacts"""
+
+    def __init__(self, root='models', legacy_dir='.', check_interval=2.0, cache_size=PREDICTION_CACHE_SIZE):
+        self.root = root
+        self.legacy_dir = legacy_dir
+        self.check_interval = check_interval
+        self.prediction_cache = LRUCache(cache_size)
+        self._bundle = None
+        self._active_stamp = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def _active_path(self):
+        return os.path.join(self.root, ACTIVE_FILE)
+
+    def _version_dir(self, version):
+        if version == LEGACY_VERSION:
+            return self.legacy_dir
+        return os.path.join(self.root, version)
+
+    def active_version(self):
+        """Version named by the ACTIVE file, or the legacy root pickles"""
+        try:
+            with open(self._active_path()) as f:
+                return f.read().strip() or LEGACY_VERSION
+        except FileNotFoundError:
+            return LEGACY_VERSION
+
+    def versions(self):
+        """Published versions with their manifests, oldest first"""
+        found = []
+        if os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                manifest_path = os.path.join(self.root, name, MANIFEST_FILE)
+                if os.path.isfile(manifest_path):
+                    with open(manifest_path) as f:
+                        found.append(json.load(f))
+        return found
+
+    def load(self, version):
+        """Load a version's artifacts, memory-mapping their arrays read-only"""
+        return self._load_dir(self._version_dir(version), version)
+
+    def _load_dir(self, path, version):
+        artifacts = {}
+        for name in REQUIRED_ARTIFACTS + OPTIONAL_ARTIFACTS:
+            artifact_path = os.path.join(path, name)
+            if os.path.exists(artifact_path):
+                artifacts[name] = joblib.load(artifact_path, mmap_mode='r')
+            elif name in REQUIRED_ARTIFACTS:
+                raise FileNotFoundError(f'Model version {version} is missing {name}')
+        return ModelBundle(
+            version, path,
+            artifacts['pca_model.pkl'],
+            artifacts['kmeans_model.pkl'],
+            encoder=artifacts.get('encoder.pkl'),
+            feature_columns=artifacts.get('feature_columns.pkl'),
+            risk_labels=artifacts.get('risk_labels.pkl')
+        )
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self._active_path())
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def current(self):
+        """The bundle to serve this request with.
+
+        Checks the ACTIVE file at most every `check_interval` seconds. One
+        thread loads a new version while the others keep serving the old
+        bundle; the swap is a single reference assignment.
+        """
+        bundle = self._bundle
+        now = time.monotonic()
+        if bundle is not None and now < self._next_check:
+            return bundle
+        if not self._reload_lock.acquire(blocking=bundle is None):
+            return bundle
+        try:
+            self._next_check = now + self.check_interval
+            stamp = self._stamp()
+            if self._bundle is None or stamp != self._active_stamp:
+                version = self.active_version()
+                if self._bundle is None:
+                    self._bundle = self.load(version)
+                elif version != self._bundle.version:
+                    try:
+                        self._bundle = self.load(version)
+                        # Keys carry the version, so this only frees the old model's entries
+                        self.prediction_cache.clear()
+                    except Exception as e:
+                        # Keep serving the loaded version rather than failing requests
+                        print(f"Error loading model version {version}: {e}")
+                self._active_stamp = stamp
+            return self._bundle
+        finally:
+            self._reload_lock.release()
+
+    def predict_one(self, age, billing_amount, room_number):
+        """Score one patient with the active model, memoized per model version.
+
+        Returns (risk_level, model_version).
+        """
+        bundle = self.current()
+        key = (bundle.version, float(age), float(billing_amount), float(room_number))
+        result = self.prediction_cache.get(key)
+        if result is None:
+            PREDICTION_CACHE.labels('miss').inc()
+            result = bundle.engine.predict_one(*key[1:])
+            self.prediction_cache.set(key, result)
+        else:
+            PREDICTION_CACHE.labels('hit').inc()
+        return result, bundle.version
+
+    def reload(self):
+        """Force the next current() call to re-read the ACTIVE file"""
+        self._next_check = 0.0
+        self._active_stamp = None
+
+    def publish(self, source_dir, version=None, activate=False):
+        """Copy the artifacts in source_dir into a new immutable version"""
+        version = version or datetime.now().strftime('v%Y%m%d-%H%M%S')
+        if version == LEGACY_VERSION or os.sep in version or version.startswith('.'):
+            raise ValueError(f'Invalid model version name: {version}')
+        target = os.path.join(self.root, version)
+        if os.path.exists(target):
+            raise ValueError(f'Model version {version} already exists')
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=self.root)
+        try:
+            manifest = {'version': version, 'created_at': datetime.now().isoformat(timespec='seconds'),
+                        'artifacts': {}}
+            for name in REQUIRED_ARTIFACTS + OPTIONAL_ARTIFACTS:
+                source = os.path.join(source_dir, name)
+                if not os.path.exists(source):
+                    if name in REQUIRED_ARTIFACTS:
+                        raise FileNotFoundError(f'{source} not found')
+                    continue
+                shutil.copy2(source, os.path.join(staging, name))
+                manifest['artifacts'][name] = _sha256(source)
+            with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+                json.dump(manifest, f, indent=2)
+
+            # Check the artifacts load before the version becomes visible
+            bundle = self._load_dir(staging, version)
+            if bundle.features_error:
+                raise ValueError(f'Model version {version}: {bundle.features_error}')
+            os.rename(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        return manifest
+
+    def activate(self, version):
+        """Point every worker at `version` by atomically replacing the ACTIVE file"""
+        if version != LEGACY_VERSION and not os.path.isfile(
+                os.path.join(self.root, version, MANIFEST_FILE)):
+            raise ValueError(f'Unknown model version: {version}')
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.ACTIVE-', dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, self._active_path())
+        self.reload()
@@ -0,0 +1,236 @@
+"""
+Retention: move old predictions out of the live database into monthly archives
+
+Predictions older than the retention window are copied, decoded, into
+<archive_dir>/predictions_YYYY_MM.db and deleted from the live database only
+once the archive holds every one of them. Work goes in small batches so the
+write lock is never held for long and the app keeps serving meanwhile.
+
+Archives are plain SQLite files with one `predictions` table in the export
+layout (see export.EXPORT_COLUMNS), so they need neither the live schema nor
+its lookup tables. They are opened read-only for historical queries and
+exports.
+
+Archived rows stay in the dashboard counts and trends: their ids are listed
+in archive_batch while they are deleted, which the count and rollup triggers
+skip, and their counts go to the archived_* rollup tables that rebuilds add
+back (see database.archive_aware_delete_triggers). History and search cover
+the live window only. Patients and vocab rows are shared and stay behind.
+"""
+
+import os
+import re
+import sqlite3
+from urllib.parse import quote
+
+from database import ARCHIVE_BATCH_TABLE, PREDICTION_DETAILS_VIEW, prediction_filters, record_archived_counts
+from export import EXPORT_COLUMNS
+
+ARCHIVE_FILE = re.compile(r'^predictions_(\d{4})_(\d{2})\.db$')
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}predictions (
+        id INTEGER PRIMARY KEY,
+        created_at TIMESTAMP NOT NULL,
+        user_id INTEGER NOT NULL,
+        user_name TEXT,
+        patient_name TEXT,
+        age INTEGER NOT NULL,
+        gender TEXT,
+        blood_type TEXT,
+        medical_condition TEXT,
+        admission_type TEXT,
+        medication TEXT,
+        insurance_provider TEXT,
+        room_number INTEGER NOT NULL,
+        billing_amount REAL NOT NULL,
+        risk_level TEXT NOT NULL,
+        model_version TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS {schema}idx_predictions_created ON predictions (created_at)',
+    'CREATE INDEX IF NOT EXISTS {schema}idx_predictions_user_created ON predictions (user_id, created_at)'
+]
+BATCH_SIZE = 5000
+
+
+class RetentionError(RuntimeError):
+    """The archive does not hold the rows about to be deleted"""
+
+
+def archive_path(archive_dir, month):
+    """Archive file for a 'YYYY-MM' month"""
+    return os.path.join(archive_dir, f"predictions_{month.replace('-', '_')}.db")
+
+
+def list_archives(archive_dir):
+    """(month, path) of every archive file, oldest first"""
+    if not os.path.isdir(archive_dir):
+        return []
+    archives = []
+    for name in os.listdir(archive_dir):
+        match = ARCHIVE_FILE.match(name)
+        if match:
+            archives.append((f'{match[1]}-{match[2]}', os.path.join(archive_dir, name)))
+    return sorted(archives)
+
+
+def open_archive(path):
+    """Read-only connection to one archive file"""
+    conn = sqlite3.connect(f'file:{quote(os.path.abspath(path))}?mode=ro', uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def archive_summary(archive_dir):
+    """Row count, date range and size of every archive file"""
+    summary = []
+    for month, path in list_archives(archive_dir):
+        conn = open_archive(path)
+        try:
+            rows, first, last = conn.execute(
+                'SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM predictions').fetchone()
+        finally:
+            conn.close()
+        summary.append({'month': month, 'path': path, 'rows': rows, 'first': first, 'last': last,
+                        'bytes': os.path.getsize(path)})
+    return summary
+
+
+def retention_cutoff(db, days):
+    """created_at timestamp before which predictions fall outside a `days` window"""
+    with db.connection() as conn:
+        # Same clock and format as the CURRENT_TIMESTAMP default on predictions
+        return conn.execute("SELECT datetime('now', ?)", (f'-{int(days)} days',)).fetchone()[0]
+
+
+def plan_archive(db, cutoff):
+    """{'YYYY-MM': rows} of live predictions created before `cutoff`"""
+    with db.connection() as conn:
+        rows = conn.execute('''
+            SELECT substr(created_at, 1, 7), COUNT(*)
+            FROM predictions
+            WHERE created_at < ?
+            GROUP BY 1
+            ORDER BY 1
+        ''', (cutoff,)).fetchall()
+    return {month: count for month, count in rows}
+
+
+def _month_end(month):
+    year, number = map(int, month.split('-'))
+    year, number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return f'{year:04d}-{number:02d}-01'
+
+
+def _archive_month(conn, month, cutoff, path, batch_size):
+    """Move one month's rows before `cutoff` into `path`; returns the rows moved"""
+    start, end = f'{month}-01', min(_month_end(month), cutoff)
+    columns = ', '.join(EXPORT_COLUMNS)
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement.format(schema='archive.'))
+        conn.commit()
+
+        moved = 0
+        while True:
+            conn.execute(f'DELETE FROM main.{ARCHIVE_BATCH_TABLE}')
+            selected = conn.execute(f'''
+                INSERT INTO main.{ARCHIVE_BATCH_TABLE} (id)
+                SELECT id FROM main.predictions
+                WHERE created_at >= ? AND created_at < ?
+                ORDER BY created_at, id
+                LIMIT ?
+            ''', (start, end, batch_size)).rowcount
+            if not selected:
+                conn.commit()
+                break
+
+            # 1. Copy and commit to the archive (re-running after a crash just rewrites the same ids)
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.predictions ({columns})
+                SELECT {columns} FROM main.{PREDICTION_DETAILS_VIEW}
+                WHERE id IN (SELECT id FROM main.{ARCHIVE_BATCH_TABLE})
+            ''')
+            conn.commit()
+            # 2. Verify every selected row made it
+            archived = conn.execute(f'''
+                SELECT COUNT(*) FROM archive.predictions
+                WHERE id IN (SELECT id FROM main.{ARCHIVE_BATCH_TABLE})
+            ''').fetchone()[0]
+            if archived != selected:
+                raise RetentionError(f'{month}: archived {archived} of {selected} rows; nothing deleted')
+            # 3. Only then delete them from the live table, keeping their counts
+            record_archived_counts(conn)
+            deleted = conn.execute(f'''
+                DELETE FROM main.predictions WHERE id IN (SELECT id FROM main.{ARCHIVE_BATCH_TABLE})
+            ''').rowcount
+            if deleted != selected:
+                conn.rollback()
+                raise RetentionError(f'{month}: would delete {deleted} rows but archived {selected}')
+            conn.commit()
+            moved += selected
+        return moved
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute(f'DELETE FROM main.{ARCHIVE_BATCH_TABLE}')
+        conn.commit()
+        conn.execute('DETACH DATABASE archive')
+
+
+def archive_predictions(db, cutoff, archive_dir, batch_size=BATCH_SIZE, dry_run=False, progress=None):
+    """Move predictions created before `cutoff` into monthly archive files.
+
+    Returns {'YYYY-MM': rows} moved (or, with dry_run, that would be moved).
+    `progress(month, rows)` is called after each month. Raises RetentionError
+    if an archive does not hold a batch or rows before the cutoff remain.
+    """
+    plan = plan_archive(db, cutoff)
+    if dry_run or not plan:
+        return plan
+
+    os.makedirs(archive_dir, exist_ok=True)
+    moved = {}
+    with db.connection() as conn:
+        for month in plan:
+            moved[month] = _archive_month(conn, month, cutoff, archive_path(archive_dir, month), batch_size)
+            if progress:
+                progress(month, moved[month])
+
+    left = sum(plan_archive(db, cutoff).values())
+    if left:
+        raise RetentionError(f'{left} predictions before {cutoff} are still in the live database')
+    return moved
+
+
+def iter_archived_batches(archive_dir, user_id=None, batch_size=BATCH_SIZE, **filters):
+    """Stream archived predictions oldest first, like Database.iter_prediction_batches.
+
+    Only archives whose month overlaps date_from/date_to are opened, one at a
+    time and read-only.
+    """
+    clauses, params = prediction_filters(user_id, **filters)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    first = (filters.get('date_from') or '')[:7]
+    last = (filters.get('date_to') or '9999-12')[:7]
+
+    for month, path in list_archives(archive_dir):
+        if not first <= month <= last:
+            continue
+        conn = open_archive(path)
+        try:
+            cursor = conn.execute(f'''
+                SELECT p.*
+                FROM predictions p
+                {where}
+                ORDER BY p.created_at, p.id
+            ''', params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+        finally:
+            conn.close()
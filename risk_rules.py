@@ -0,0 +1,31 @@
+"""
+Rule-based risk scoring used to generate realistic seed data and to
+calibrate model clusters. Mirrors the factors in seed_data.create_predictions.
+All functions accept scalars or NumPy arrays.
+"""
+
+import numpy as np
+
+HIGH_RISK_CONDITIONS = ["Cancer", "Diabetes"]
+MODERATE_RISK_CONDITIONS = ["Hypertension", "Obesity"]
+
+
+def risk_scores(age, billing_amount, medical_condition, admission_type):
+    """Additive risk score (0-8) from age, billing, condition and admission type"""
+    age = np.asarray(age, dtype=float)
+    billing_amount = np.asarray(billing_amount, dtype=float)
+    medical_condition = np.asarray(medical_condition, dtype=object)
+    admission_type = np.asarray(admission_type, dtype=object)
+
+    score = np.where(age > 70, 2, np.where(age > 50, 1, 0))
+    score += np.where(billing_amount > 30000, 2, np.where(billing_amount > 15000, 1, 0))
+    score += np.where(np.isin(medical_condition, HIGH_RISK_CONDITIONS), 2,
+                      np.where(np.isin(medical_condition, MODERATE_RISK_CONDITIONS), 1, 0))
+    score += np.where(admission_type == "Emergency", 2, np.where(admission_type == "Urgent", 1, 0))
+    return score
+
+
+def risk_levels(scores):
+    """Map risk scores to labels: >=5 High, >=3 Medium, otherwise Low"""
+    scores = np.asarray(scores)
+    return np.where(scores >= 5, "High Risk", np.where(scores >= 3, "Medium Risk", "Low Risk")).astype(object)
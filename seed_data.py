@@ -1,14 +1,24 @@
 """
 Seed Data Script for Healthcare Risk Prediction System
 Populates the database with sample users and predictions to simulate an active system
+
+Usage:
+    python seed_data.py                      # demo data: 17 users, 150 predictions
+    python seed_data.py --rows 5000000       # bulk mode: top the predictions table up to 5M rows
 """
 
-from database import Database
+from database import Database, PREDICTION_COLUMNS, PASSWORD_HASH_METHOD
+from config import get_config
+from risk_rules import risk_scores, risk_levels
+from werkzeug.security import generate_password_hash
+import argparse
 import random
+import time
+import numpy as np
 from datetime import datetime, timedelta
 
-# Initialize database
-db = Database()
+# Initialize database (main() may point this at another file)
+db = None
 
 # Sample data
 FIRST_NAMES = [
@@ -232,6 +242,88 @@ def update_prediction_timestamps():
     conn.close()
     print("  ✓ Timestamps updated")
 
+# Bulk mode roster: (role, username prefix, count)
+BULK_STAFF = [("Doctor", "bulkdr", 50), ("Nurse", "bulknurse", 120), ("Receptionist", "bulkreception", 30)]
+SEED_PASSWORD = "password123"
+
+def create_bulk_users():
+    """Create the bulk-mode staff roster, hashing the shared password only once"""
+    password_hash = generate_password_hash(SEED_PASSWORD, method=PASSWORD_HASH_METHOD)
+    users = []
+    for role, prefix, count in BULK_STAFF:
+        for i in range(count):
+            username = f"{prefix}{i+1}"
+            first_name = FIRST_NAMES[i % len(FIRST_NAMES)]
+            last_name = LAST_NAMES[(i * 7) % len(LAST_NAMES)]
+            full_name = f"Dr. {first_name} {last_name}" if role == "Doctor" else f"{first_name} {last_name}"
+            users.append((username, f"{username}@hospital.com", role, full_name))
+    
+    created = db.bulk_create_users(users, password_hash)
+    print(f"  ✓ {created} new staff accounts ({len(users)} in roster)")
+
+def generate_prediction_batch(rng, size, user_ids, end_date):
+    """Generate `size` prediction rows as PREDICTION_COLUMNS + created_at tuples"""
+    age = rng.integers(18, 86, size)
+    room_number = rng.integers(100, 501, size)
+    billing_amount = np.round(rng.uniform(5000, 50000, size), 2)
+    medical_condition = rng.choice(np.array(MEDICAL_CONDITIONS, dtype=object), size)
+    admission_type = rng.choice(np.array(ADMISSION_TYPES, dtype=object), size)
+    
+    risk_level = risk_levels(risk_scores(age, billing_amount, medical_condition, admission_type))
+    
+    # Same shape as update_prediction_timestamps: exponential, mean 30 days, capped at 90, business hours
+    days_ago = np.minimum(rng.exponential(30, size).astype(np.int64), 90)
+    seconds_ago = days_ago * 86400 + rng.integers(8, 19, size) * 3600 + rng.integers(0, 60, size) * 60
+    created_at = (np.datetime64(end_date.replace(microsecond=0), 's') - seconds_ago.astype('timedelta64[s]'))
+    created_at = np.char.replace(created_at.astype(str), 'T', ' ')
+    
+    columns = {
+        'user_id': rng.choice(user_ids, size),
+        'patient_name': rng.choice(np.array(PATIENT_NAMES, dtype=object), size),
+        'age': age,
+        'room_number': room_number,
+        'billing_amount': billing_amount,
+        'gender': rng.choice(np.array(GENDERS, dtype=object), size),
+        'blood_type': rng.choice(np.array(BLOOD_TYPES, dtype=object), size),
+        'medical_condition': medical_condition,
+        'admission_type': admission_type,
+        'medication': rng.choice(np.array(MEDICATIONS, dtype=object), size),
+        'insurance_provider': rng.choice(np.array(INSURANCE_PROVIDERS, dtype=object), size),
+        'risk_level': risk_level,
+        'model_version': np.full(size, None, dtype=object)
+    }
+    return list(zip(*(columns[name].tolist() for name in PREDICTION_COLUMNS), created_at.tolist()))
+
+def bulk_seed(target_rows, batch_size=50000, seed=None):
+    """Top the predictions table up to `target_rows`, one transaction per batch.
+    
+    Interrupted runs resume: rerunning with the same target only adds what is missing.
+    """
+    print("Creating staff...")
+    create_bulk_users()
+    user_ids = np.array([u['id'] for u in db.get_all_users()])
+    
+    existing = db.get_statistics()['total_predictions']
+    remaining = target_rows - existing
+    if remaining <= 0:
+        print(f"\n✓ Already {existing} predictions (target {target_rows}), nothing to do")
+        return 0
+    
+    print(f"\nCreating {remaining} predictions ({existing} already present)...")
+    # Seed on the starting row count so resumed runs don't repeat earlier batches
+    rng = np.random.default_rng([seed if seed is not None else random.randrange(2**32), existing])
+    end_date = datetime.now()
+    started = time.perf_counter()
+    written = 0
+    while written < remaining:
+        size = min(batch_size, remaining - written)
+        db.bulk_insert_predictions(generate_prediction_batch(rng, size, user_ids, end_date))
+        written += size
+        elapsed = time.perf_counter() - started
+        print(f"  ✓ {existing + written}/{target_rows} rows ({written / elapsed:,.0f} rows/s)")
+    
+    return written
+
 def print_statistics():
     """Print database statistics"""
     print("\n" + "="*60)
@@ -283,18 +375,32 @@ def print_statistics():
 
 def main():
     """Main function to seed the database"""
+    global db
+    
+    parser = argparse.ArgumentParser(description="Seed the healthcare database with sample data")
+    parser.add_argument('--db', help='SQLite database file (default: db_path from the config)')
+    parser.add_argument('--rows', type=int, help='Bulk mode: total number of predictions to reach')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Rows per transaction in bulk mode')
+    parser.add_argument('--seed', type=int, help='Random seed for bulk mode')
+    args = parser.parse_args()
+    
+    db = Database(args.db or get_config().db_path)
+    
     print("\n" + "="*60)
     print("HEALTHCARE SYSTEM - DATABASE SEEDING")
     print("="*60 + "\n")
     
-    # Create users
-    users = create_users()
-    
-    # Create predictions
-    predictions_count = create_predictions(users)
-    
-    # Update timestamps to spread over time
-    update_prediction_timestamps()
+    if args.rows is not None:
+        bulk_seed(args.rows, batch_size=args.batch_size, seed=args.seed)
+    else:
+        # Create users
+        users = create_users()
+        
+        # Create predictions
+        predictions_count = create_predictions(users)
+        
+        # Update timestamps to spread over time
+        update_prediction_timestamps()
     
     # Print statistics
     print_statistics()
@@ -0,0 +1,249 @@
+"""
+Production entry point: a pre-forking multi-process server for app.py
+
+    python serve.py --workers 4 --threads 8 --port 8000
+
+The parent imports the app once (models unpickled and memory-mapped, schema
+migrated), closes its database connections, opens the listening socket and
+forks the workers, so model pages are shared copy-on-write. Each worker
+serves requests on a fixed-size thread pool.
+
+Signals to the parent:
+    SIGTERM / SIGINT  finish in-flight requests, then exit
+    SIGHUP            graceful reload: re-read the active model version, start a
+                      fresh generation of workers, then retire the old one
+Crashed workers are replaced. Liveness and readiness are on /healthz and /readyz.
+/metrics answers for all workers together: each one snapshots its counters to a
+shared temporary directory (metrics.SnapshotDir) and the answering worker sums them.
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+import app as app_module
+from metrics import SnapshotDir
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server handling connections on a bounded thread pool"""
+
+    multithread = True
+
+    def __init__(self, *args, threads=8, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self):
+        """Wait for requests already accepted to finish"""
+        self._pool.shutdown(wait=True)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that leaves access logging to a proxy in front"""
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+def listen(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def release_process_resources():
+    """Close what must not be shared across fork: SQLite handles and writer threads"""
+    app_module.stop_prediction_writer()
+    app_module.db.close()
+
+
+def run_worker(worker_id, sock, args):
+    """Body of a forked worker process; never returns"""
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    app_module.metrics_snapshots.start()
+    app_module.start_prediction_writer()
+
+    handler = WSGIRequestHandler if args.access_log else QuietRequestHandler
+    server = PooledWSGIServer(args.host, args.port, app_module.app, handler=handler,
+                              threads=args.threads, fd=sock.fileno())
+
+    def stop(signum, frame):
+        # shutdown() blocks until serve_forever returns, so call it off the main thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the parent, which stops us
+
+    status = 0
+    try:
+        server.serve_forever()
+        server.drain()
+    except Exception as e:
+        print(f"[worker {worker_id}] {e}", file=sys.stderr)
+        status = 1
+    finally:
+        release_process_resources()
+        app_module.metrics_snapshots.stop()
+    # Skip the parent's atexit handlers inherited through fork
+    os._exit(status)
+
+
+class Arbiter:
+    """Parent process: forks, supervises and replaces workers"""
+
+    def __init__(self, sock, args, snapshots):
+        self.sock = sock
+        self.args = args
+        self.snapshots = snapshots
+        self.workers = {}  # pid -> worker slot
+        self.retiring = set()
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self, slot):
+        # The parent's own counts (startup, reloads) are reported from its snapshot
+        self.snapshots.write()
+        pid = os.fork()
+        if pid == 0:
+            run_worker(slot, self.sock, self.args)
+        self.workers[pid] = slot
+        return pid
+
+    def reload(self):
+        """Start a new generation of workers, then retire the current one"""
+        app_module.model_registry.reload()
+        bundle = app_module.model_registry.current()
+        release_process_resources()
+        old = list(self.workers)
+        for slot in range(self.args.workers):
+            self.spawn(slot)
+        for pid in old:
+            self.workers.pop(pid, None)
+            self.retiring.add(pid)
+            self._kill(pid, signal.SIGTERM)
+        print(f"Reloaded: {self.args.workers} workers on model version {bundle.version}")
+
+    def _kill(self, pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.snapshots.retire(pid)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            slot = self.workers.pop(pid, None)
+            if slot is not None and not self.stopping:
+                print(f"Worker {pid} exited with status {status}; restarting", file=sys.stderr)
+                time.sleep(0.5)  # avoid a tight crash loop
+                self.spawn(slot)
+
+    def run(self):
+        def on_stop(signum, frame):
+            self.stopping = True
+
+        def on_reload(signum, frame):
+            self.reload_requested = True
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+
+        for slot in range(self.args.workers):
+            self.spawn(slot)
+        print(f"Serving on http://{self.args.host}:{self.args.port} with {self.args.workers} workers "
+              f"x {self.args.threads} threads (model version {app_module.model_registry.current().version})")
+
+        while not self.stopping:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self._reap()
+            time.sleep(0.2)
+
+        # Graceful stop: workers finish in-flight requests, stragglers are killed after the timeout
+        for pid in list(self.workers) + list(self.retiring):
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.args.graceful_timeout
+        while (self.workers or self.retiring) and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.1)
+                continue
+            self.snapshots.retire(pid)
+            self.workers.pop(pid, None)
+            self.retiring.discard(pid)
+        for pid in list(self.workers) + list(self.retiring):
+            self._kill(pid, signal.SIGKILL)
+        self.sock.close()
+        return 0
+
+
+def main(argv=None):
+    # Defaults come from the deployment config (HRP_HOST, HRP_WORKERS, ...)
+    config = app_module.config
+    parser = argparse.ArgumentParser(description="Serve the Healthcare Risk Prediction app with forked workers")
+    parser.add_argument('--host', default=config.host)
+    parser.add_argument('--port', type=int, default=config.port)
+    parser.add_argument('--workers', type=int, default=config.workers or os.cpu_count() or 1,
+                        help='Worker processes')
+    parser.add_argument('--threads', type=int, default=config.threads, help='Request threads per worker')
+    parser.add_argument('--graceful-timeout', type=float, default=config.graceful_timeout,
+                        help='Seconds to let in-flight requests finish on shutdown')
+    parser.add_argument('--access-log', action='store_true', help='Log every request to stderr')
+    args = parser.parse_args(argv)
+
+    sock = listen(args.host, args.port)
+    if not hasattr(os, 'fork'):
+        # No fork on Windows: serve from this process alone
+        print(f"Serving on http://{args.host}:{args.port} (single process, {args.threads} threads)")
+        server = PooledWSGIServer(args.host, args.port, app_module.app, threads=args.threads, fd=sock.fileno())
+        server.serve_forever()
+        return 0
+
+    release_process_resources()
+    metrics_dir = tempfile.mkdtemp(prefix='hrp-metrics-')
+    app_module.metrics_snapshots = SnapshotDir(metrics_dir)
+    try:
+        return Arbiter(sock, args, app_module.metrics_snapshots).run()
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
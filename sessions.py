@@ -0,0 +1,133 @@
+"""
+Server-side Flask sessions stored in the application's SQLite database
+The cookie carries only a random session id. Session data lives in the
+sessions table, so a user's sessions can be revoked centrally
+(Database.revoke_sessions) and role or name changes never depend on what
+an old cookie says.
+
+Only logged-in sessions are stored. Anonymous ones (e.g. a flash message
+after a failed login or a login_required redirect) travel in a separate
+signed cookie, so unauthenticated clients cannot add rows to the table.
+"""
+
+import secrets
+from datetime import datetime, timezone
+
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it changed"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.previous_sid = None
+        # Whether the request carried an anonymous session cookie
+        self.anonymous_cookie = False
+
+    def regenerate(self):
+        """Move the session to a fresh id (call on login to prevent fixation)"""
+        if self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SqliteSessionInterface(SessionInterface):
+    """Flask session interface backed by Database session methods"""
+
+    serializer = TaggedJSONSerializer()
+    anonymous_salt = 'anonymous-session'
+
+    def __init__(self, db):
+        self.db = db
+
+    def anonymous_cookie_name(self, app):
+        return f'{self.get_cookie_name(app)}_anon'
+
+    def anonymous_signer(self, app):
+        return URLSafeTimedSerializer(app.secret_key, salt=self.anonymous_salt, serializer=self.serializer)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.db.load_session(sid)
+            if data is not None:
+                try:
+                    return ServerSideSession(self.serializer.loads(data), sid=sid)
+                except ValueError:
+                    pass
+
+        session = ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+        anonymous = request.cookies.get(self.anonymous_cookie_name(app))
+        if anonymous:
+            session.anonymous_cookie = True
+            try:
+                max_age = int(app.permanent_session_lifetime.total_seconds())
+                session.update(self.anonymous_signer(app).loads(anonymous, max_age=max_age))
+            except BadSignature:
+                pass
+            session.modified = False
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.previous_sid:
+            self.db.delete_session(session.previous_sid)
+
+        if not session.get('user_id'):
+            # Logged out (or never logged in): drop any stored row, keep leftovers in a signed cookie
+            if session.modified and not session.new:
+                self.db.delete_session(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            self._save_anonymous(app, session, response)
+            return
+        if session.anonymous_cookie:
+            response.delete_cookie(self.anonymous_cookie_name(app), domain=domain, path=path)
+
+        if not (session.modified or self.should_set_cookie(app, session)):
+            return
+
+        # Server-side expiry always applies; the cookie itself is only persistent for permanent sessions
+        expires_at = datetime.now(timezone.utc).replace(tzinfo=None) + app.permanent_session_lifetime
+        self.db.save_session(session.sid, session.get('user_id'), self.serializer.dumps(dict(session)), expires_at)
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def _save_anonymous(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.anonymous_cookie:
+                response.delete_cookie(self.anonymous_cookie_name(app), domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+        response.set_cookie(
+            self.anonymous_cookie_name(app),
+            self.anonymous_signer(app).dumps(dict(session)),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
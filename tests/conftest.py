@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing app opens the configured database; keep it out of the project directory
+os.environ.setdefault('HRP_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='hrp-tests-'), 'healthcare.db'))
+
+
+@pytest.fixture(scope='session')
+def client():
+    """Test client logged in as a doctor"""
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    app_module.db.create_user('tester', 'tester@example.com', 'pw', 'Doctor', 'Tester')
+    client = app_module.app.test_client()
+    client.post('/login', data={'username': 'tester', 'password': 'pw'})
+    return client
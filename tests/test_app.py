@@ -0,0 +1,18 @@
+from io import BytesIO
+
+
+def test_batch_json_with_conflicting_columns_names_them(client):
+    response = client.post('/predict/batch', json=[
+        {'Age': 40, 'age': 41, 'Room Number': 300, 'Billing Amount': 20000}
+    ])
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Columns map to the same field: Age and age (age)'
+
+
+def test_batch_csv_with_conflicting_columns_names_them(client):
+    csv = b'Age,age,Room Number,Billing Amount,room_number\n40,41,300,20000,301\n'
+    response = client.post('/predict/batch', data={'file': (BytesIO(csv), 'batch.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == ('Columns map to the same field: Age and age (age); '
+                                            'Room Number and room_number (room_number)')
@@ -0,0 +1,52 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+
+from inference import RiskEngine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return RiskEngine(joblib.load(os.path.join(ROOT, 'pca_model.pkl')),
+                      joblib.load(os.path.join(ROOT, 'kmeans_model.pkl')))
+
+
+@pytest.mark.parametrize('age', [float('nan'), float('inf'), float('-inf'), -1e308, 1e200])
+def test_predict_one_rejects_non_finite_and_overflowing_input(engine, age):
+    with pytest.raises(ValueError):
+        engine.predict_one(age, 20000.0, 300.0)
+
+
+def test_predict_many_rejects_a_non_finite_row(engine):
+    assert len(engine.predict_many([40.0, 70.0], [20000.0, 45000.0], [300.0, 120.0])) == 2
+    with pytest.raises(ValueError):
+        engine.predict_many([40.0, np.nan], [20000.0, 45000.0], [300.0, 120.0])
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-1e308', 'abc'])
+def test_predict_form_flashes_an_error_for_invalid_numbers(client, value):
+    response = client.post('/predict', data={'age': value, 'room_number': '300', 'billing_amount': '20000'})
+    assert response.status_code == 200
+    assert b'Prediction completed' not in response.data
+    assert b'Age' in response.data
+
+
+@pytest.mark.parametrize('age', ['NaN', 'Infinity', '-1e308'])
+def test_predict_batch_returns_400_for_invalid_numbers(client, age):
+    body = f'[{{"Age": {age}, "Room Number": 300, "Billing Amount": 20000}}]'
+    response = client.post('/predict/batch', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_predict_reports_a_failed_save(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'prediction_writer', None)
+    monkeypatch.setattr(app_module.db, 'save_prediction', lambda *args: False)
+    response = client.post('/predict', data={'age': '40', 'room_number': '300', 'billing_amount': '20000'})
+    assert b'Prediction completed' not in response.data
+    assert b'could not be saved' in response.data
@@ -0,0 +1,53 @@
+import json
+import os
+
+from metrics import Counter, Histogram, Registry, SnapshotDir
+
+
+def make_registry():
+    registry = Registry()
+    requests = Counter('requests_total', 'Requests', ['status'], registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0), registry=registry)
+    return registry, requests, latency
+
+
+def write_worker(path, pid, hits, latencies):
+    """Snapshot file of another worker process"""
+    registry, requests, latency = make_registry()
+    requests.labels('200').inc(hits)
+    for value in latencies:
+        latency.observe(value)
+    with open(os.path.join(path, f'{pid}.json'), 'w') as f:
+        json.dump(registry.snapshot(), f)
+
+
+def test_render_sums_every_worker_and_survives_retirement(tmp_path):
+    registry, requests, latency = make_registry()
+    snapshots = SnapshotDir(str(tmp_path), registry=registry)
+    requests.labels('200').inc(2)
+    requests.labels('500').inc()
+    latency.observe(0.05)
+    write_worker(str(tmp_path), 999991, 5, [0.5, 2.0])
+
+    text = snapshots.render()
+    assert 'requests_total{status="200"} 7' in text
+    assert 'requests_total{status="500"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_count 3' in text
+
+    # The reaped worker's counts move to retired.json; the totals stay put
+    snapshots.retire(999991)
+    assert not os.path.exists(tmp_path / '999991.json')
+    assert snapshots.render() == text
+
+
+def test_forked_worker_starts_from_zero(tmp_path):
+    registry, requests, _ = make_registry()
+    requests.labels('200').inc(3)
+    snapshots = SnapshotDir(str(tmp_path), registry=registry, interval=60)
+    snapshots.start()
+    requests.labels('200').inc()
+    snapshots.stop()
+    with open(tmp_path / f'{os.getpid()}.json') as f:
+        assert json.load(f)['requests_total'] == [[['200'], 1]]
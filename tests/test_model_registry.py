@@ -0,0 +1,40 @@
+import os
+import shutil
+
+import joblib
+import pytest
+
+from model_registry import ModelRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_artifacts(path, extra_columns=()):
+    os.makedirs(path)
+    for name in ('pca_model.pkl', 'kmeans_model.pkl', 'encoder.pkl'):
+        shutil.copy(os.path.join(ROOT, name), os.path.join(path, name))
+    columns = joblib.load(os.path.join(ROOT, 'feature_columns.pkl'))
+    joblib.dump(list(columns) + list(extra_columns), os.path.join(path, 'feature_columns.pkl'))
+
+
+def test_mismatched_feature_columns_do_not_block_loading(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    write_artifacts(str(tmp_path / 'models' / 'v1'), ['Gender_Unknown'])
+
+    bundle = registry.load('v1')
+
+    assert bundle.features is None
+    assert 'Gender_Unknown' in bundle.features_error
+    assert bundle.engine.predict_one(40.0, 20000.0, 300.0) in bundle.risk_labels
+
+
+def test_publish_rejects_mismatched_feature_columns(tmp_path):
+    registry = ModelRegistry(str(tmp_path / 'models'))
+    write_artifacts(str(tmp_path / 'bad'), ['Gender_Unknown'])
+    with pytest.raises(ValueError, match='Gender_Unknown'):
+        registry.publish(str(tmp_path / 'bad'), 'v1')
+    assert registry.versions() == []
+
+    write_artifacts(str(tmp_path / 'good'))
+    assert registry.publish(str(tmp_path / 'good'), 'v2')['version'] == 'v2'
+    assert registry.load('v2').features is not None
@@ -0,0 +1,50 @@
+from database import Database
+from retention import archive_predictions, iter_archived_batches
+
+
+def make_rows(user_ids, count):
+    """PREDICTION_COLUMNS + created_at tuples spread over 2023-01 .. 2024-06"""
+    conditions = ['Diabetes', 'Cancer', 'Asthma']
+    admissions = ['Emergency', 'Elective']
+    levels = ['Low Risk', 'Medium Risk', 'High Risk']
+    rows = []
+    for i in range(count):
+        month = i % 18
+        created_at = f'{2023 + month // 12}-{month % 12 + 1:02d}-{i % 28 + 1:02d} {i % 24:02d}:15:00'
+        rows.append((user_ids[i % len(user_ids)], f'Patient {i % 40}', 20 + i % 60, 100 + i % 400,
+                     1000.0 + i, 'Male' if i % 2 else 'Female', 'O+', conditions[i % 3], admissions[i % 2],
+                     'Aspirin', 'Aetna', levels[i % 5 % 3], None, created_at))
+    return rows
+
+
+def snapshot(db, user_ids):
+    stats = {user_id: db.get_statistics(user_id) for user_id in [None, *user_ids]}
+    trends = [
+        db.get_risk_trends('day'),
+        db.get_risk_trends('hour'),
+        db.get_risk_trends('week', group_by='medical_condition'),
+        db.get_risk_trends('day', user_id=user_ids[0]),
+        db.get_risk_trends('day', group_by='user')
+    ]
+    return stats, trends
+
+
+def test_archiving_keeps_statistics_and_trends(tmp_path):
+    db = Database(str(tmp_path / 'live.db'), pool_size=2)
+    for i in range(3):
+        db.create_user(f'user{i}', f'u{i}@example.com', 'pw', 'Doctor', f'User {i}')
+    user_ids = [user['id'] for user in db.get_all_users()]
+    db.bulk_insert_predictions(make_rows(user_ids, 500))
+    before = snapshot(db, user_ids)
+
+    moved = archive_predictions(db, '2024-01-01 00:00:00', str(tmp_path / 'archive'), batch_size=37)
+
+    assert sum(moved.values()) == sum(1 for i in range(500) if i % 18 < 12)
+    assert sum(len(batch) for batch in iter_archived_batches(str(tmp_path / 'archive'))) == sum(moved.values())
+    assert snapshot(db, user_ids) == before
+    assert db.verify_statistics() == []
+
+    # Rebuilding from the live table adds the archived counts back
+    db.rebuild_statistics()
+    db.rebuild_trends()
+    assert snapshot(db, user_ids) == before
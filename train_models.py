@@ -0,0 +1,413 @@
+"""
+Out-of-core training for the risk model artifacts
+Reads the dataset CSV in chunks of --chunksize lines, so peak memory depends
+on --chunksize and --workers rather than on the size of the file, and writes
+the pickles the app loads: pca_model.pkl, kmeans_model.pkl, encoder.pkl, feature_columns.pkl
+and risk_labels.pkl.
+
+    python train_models.py --data healthcare_dataset.csv --output trained/
+    python train_models.py --data admissions.csv --output trained/ --publish --activate
+
+Pass 1 gathers numeric mean/variance and the categorical vocabularies,
+pass 2 fits IncrementalPCA on standardized numbers, pass 3 fits
+MiniBatchKMeans on the PCA projection, and pass 4 names the clusters: they
+are ranked by the mean rule-based risk score (risk_rules) of their members,
+lowest to highest, and mapped to Low/Medium/High Risk. A deterministic
+held-out slice of rows (--holdout) is kept out of passes 1-4 and used to
+report how often the calibrated model agrees with the rule-based labels.
+
+A quick scan of the raw bytes first splits the file into line ranges. Each
+pass then hands ranges to worker processes, which read and parse their own
+range and return partial aggregates (passes 1 and 4) or transformed arrays
+(passes 2 and 3, whose partial_fit runs in the parent in file order). Every
+pass re-reads the file; records must not contain quoted line breaks.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+from collections import Counter as CategoryCounter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import OneHotEncoder
+
+from features import CATEGORICAL_FIELDS, FeaturePipeline
+from inference import MODEL_FEATURES, RISK_LABELS
+from risk_rules import risk_scores, risk_levels
+
+CATEGORICAL_COLUMNS = list(CATEGORICAL_FIELDS)
+# Non-categorical columns kept in feature_columns.pkl (create_features_column.py layout)
+DUMMY_NUMERIC_COLUMNS = ['Age', 'Billing Amount']
+# Bytes read at a time while splitting the file into line ranges
+SCAN_BLOCK_SIZE = 1 << 24
+
+
+def holdout_mask(index, fraction, seed):
+    """Deterministic per-row held-out flag from the row's position in the file"""
+    if fraction <= 0:
+        return np.zeros(len(index), dtype=bool)
+    mixed = (np.asarray(index, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(seed)) >> np.uint64(40)
+    return (mixed % np.uint64(10000)) < int(fraction * 10000)
+
+
+def split_chunk(chunk, holdout, seed):
+    """(training rows, held-out rows) of a chunk"""
+    mask = holdout_mask(chunk.index, holdout, seed)
+    return chunk[~mask], chunk[mask]
+
+
+def numeric_rows(chunk):
+    return chunk[MODEL_FEATURES].apply(pd.to_numeric, errors='coerce').dropna()
+
+
+def cluster_labels(mean_scores, labels=RISK_LABELS):
+    """Risk label per cluster id: clusters ranked by mean risk score, lowest first.
+
+    With more clusters than labels, consecutive ranks share a label.
+    """
+    order = np.argsort(np.asarray(mean_scores, dtype=np.float64), kind='stable')
+    mapped = np.empty(len(order), dtype=object)
+    for rank, cluster in enumerate(order):
+        mapped[cluster] = labels[rank * len(labels) // len(order)]
+    return mapped
+
+
+def chunk_stats(chunk, holdout=0.0, seed=0):
+    """Pass 1 worker: numeric moments and category counts for one chunk"""
+    chunk, _ = split_chunk(chunk, holdout, seed)
+    numeric = numeric_rows(chunk).to_numpy(dtype=np.float64)
+    counts = {column: CategoryCounter(chunk[column].dropna().astype(str)) for column in CATEGORICAL_COLUMNS}
+    return len(numeric), numeric.sum(axis=0), (numeric * numeric).sum(axis=0), counts
+
+
+def chunk_standardized(chunk, mean, scale, holdout=0.0, seed=0):
+    """Pass 2 worker: the chunk's model features, standardized"""
+    chunk, _ = split_chunk(chunk, holdout, seed)
+    return (numeric_rows(chunk).to_numpy(dtype=np.float64) - mean) / scale
+
+
+def chunk_projected(chunk, mean, scale, pca_mean, components, holdout=0.0, seed=0):
+    """Pass 3 worker: the chunk projected onto the fitted principal components"""
+    return (chunk_standardized(chunk, mean, scale, holdout, seed) - pca_mean) @ components.T
+
+
+def _clusters_and_scores(chunk, mean, scale, pca_mean, components, centers):
+    chunk = chunk.assign(**{column: pd.to_numeric(chunk[column], errors='coerce') for column in MODEL_FEATURES})
+    chunk = chunk.dropna(subset=MODEL_FEATURES)
+    projected = ((chunk[MODEL_FEATURES].to_numpy(dtype=np.float64) - mean) / scale - pca_mean) @ components.T
+    distances = ((projected[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    scores = risk_scores(chunk['Age'].to_numpy(), chunk['Billing Amount'].to_numpy(),
+                         chunk['Medical Condition'].to_numpy(), chunk['Admission Type'].to_numpy())
+    return distances.argmin(axis=1), scores
+
+
+def chunk_calibration(chunk, mean, scale, pca_mean, components, centers, holdout, seed):
+    """Pass 4 worker: per-cluster score sums for training rows, and
+    (cluster, rule label) counts for held-out rows"""
+    train_rows, held_out = split_chunk(chunk, holdout, seed)
+    n_clusters = len(centers)
+    clusters, scores = _clusters_and_scores(train_rows, mean, scale, pca_mean, components, centers)
+    score_sums = np.bincount(clusters, weights=scores, minlength=n_clusters)
+    counts = np.bincount(clusters, minlength=n_clusters)
+
+    clusters, scores = _clusters_and_scores(held_out, mean, scale, pca_mean, components, centers)
+    rule_index = pd.Categorical(risk_levels(scores), categories=list(RISK_LABELS)).codes
+    confusion = np.zeros((n_clusters, len(RISK_LABELS)), dtype=np.int64)
+    np.add.at(confusion, (clusters, rule_index), 1)
+    return score_sums, counts, confusion
+
+
+def agreement_report(confusion, labels):
+    """Agreement between calibrated cluster labels and rule-based labels from a
+    (cluster x rule label) count matrix"""
+    total = int(confusion.sum())
+    label_index = {label: i for i, label in enumerate(RISK_LABELS)}
+    agree = sum(int(confusion[cluster, label_index[label]]) for cluster, label in enumerate(labels))
+    per_label = {}
+    for i, rule_label in enumerate(RISK_LABELS):
+        predicted = {label: int(confusion[[c for c, l in enumerate(labels) if l == label], i].sum())
+                     for label in RISK_LABELS}
+        per_label[rule_label] = predicted
+    return {
+        'rows': total,
+        'agreement': agree / total if total else None,
+        'confusion': per_label  # rule label -> {model label: rows}
+    }
+
+
+def plan_ranges(path, chunksize):
+    """Split the CSV after its header into (offset, length, first row) byte
+    ranges of `chunksize` lines each"""
+    ranges = []
+    with open(path, 'rb') as f:
+        f.readline()
+        start = offset = f.tell()
+        first_row, lines = 0, 0
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            position = 0
+            while lines + block.count(b'\n', position) >= chunksize:
+                for _ in range(chunksize - lines):
+                    position = block.index(b'\n', position) + 1
+                ranges.append((start, offset + position - start, first_row))
+                start, first_row, lines = offset + position, first_row + chunksize, 0
+            lines += block.count(b'\n', position)
+            offset += len(block)
+        if offset > start:
+            ranges.append((start, offset - start, first_row))
+    return ranges
+
+
+def read_range(path, columns, offset, length, first_row):
+    """Parse one planned byte range into a DataFrame indexed by row number in the file"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    # Blank lines are kept (as all-NaN rows, dropped later) so rows and lines stay aligned
+    chunk = pd.read_csv(io.BytesIO(data), header=None, names=columns,
+                        usecols=MODEL_FEATURES + CATEGORICAL_COLUMNS, skip_blank_lines=False)
+    lines = data.count(b'\n') + (not data.endswith(b'\n'))
+    if len(chunk) != lines:
+        raise ValueError(f'{path}: {lines} lines from byte {offset} parsed as {len(chunk)} rows; '
+                         'quoted line breaks are not supported')
+    chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+    return chunk
+
+
+def read_chunks(path, chunksize):
+    """Parse the CSV range by range in this process"""
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    for offset, length, first_row in plan_ranges(path, chunksize):
+        yield read_range(path, columns, offset, length, first_row)
+
+
+def _apply(func, path, columns, source, *args):
+    return func(read_range(path, columns, *source), *args)
+
+
+def parallel_ranges(executor, func, path, ranges, max_pending, *args):
+    """Read and parse each range of `path` and apply func to it in worker processes,
+    yielding results in file order.
+
+    At most max_pending ranges are in flight, which bounds memory.
+    """
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    pending = deque()
+    for source in ranges:
+        pending.append(executor.submit(_apply, func, path, columns, source, *args))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def build_encoder(vocab):
+    """OneHotEncoder with categories fixed to the streamed vocabulary"""
+    encoder = OneHotEncoder(categories=[vocab[column] for column in CATEGORICAL_COLUMNS],
+                            handle_unknown='ignore', sparse_output=False)
+    # fit() only needs one example of the columns once categories are given
+    encoder.fit(pd.DataFrame([[vocab[column][0] for column in CATEGORICAL_COLUMNS]], columns=CATEGORICAL_COLUMNS))
+    return encoder
+
+
+def fold_standardization(pca, mean, scale):
+    """Fold (x - mean) / scale into the PCA so it takes raw feature values.
+
+    ((x - mean) / scale - m) @ C.T == (x - (mean + scale * m)) @ (C / scale).T, so
+    transform() on raw inputs gives the standardized projection the clusters
+    were fitted on. The app (and RiskEngine) feed raw Age/Billing/Room values.
+    """
+    pca.mean_ = mean + scale * pca.mean_
+    pca.components_ = pca.components_ / scale
+    return pca
+
+
+def train(path, chunksize=50000, workers=None, n_components=2, n_clusters=3, epochs=1, seed=42,
+          holdout=0.1, log=print):
+    """Fit the artifacts from the CSV at `path`.
+
+    Returns (artifacts keyed by file name, held-out agreement report).
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+    started = time.perf_counter()
+    ranges = plan_ranges(path, chunksize)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Pass 1: moments and vocabularies
+        count, total, total_sq = 0, np.zeros(len(MODEL_FEATURES)), np.zeros(len(MODEL_FEATURES))
+        counts = {column: CategoryCounter() for column in CATEGORICAL_COLUMNS}
+        for n, chunk_sum, chunk_sq, chunk_counts in parallel_ranges(
+                executor, chunk_stats, path, ranges, max_pending, holdout, seed):
+            count += n
+            total += chunk_sum
+            total_sq += chunk_sq
+            for column, counter in chunk_counts.items():
+                counts[column].update(counter)
+        if count < max(n_components, n_clusters):
+            raise ValueError(f'{path} has only {count} usable rows')
+        mean = total / count
+        scale = np.sqrt(np.maximum(total_sq / count - mean * mean, 0))
+        scale[scale == 0] = 1.0
+        vocab = {column: sorted(counter) for column, counter in counts.items()}
+        missing = [column for column, values in vocab.items() if not values]
+        if missing:
+            raise ValueError(f'No values found for: {", ".join(missing)}')
+        log(f"Pass 1: {count:,} rows, {sum(map(len, vocab.values()))} categories "
+            f"({time.perf_counter() - started:.1f}s)")
+
+        # Pass 2: principal components of the standardized features
+        pca = IncrementalPCA(n_components=n_components)
+        carry = None
+        for block in parallel_ranges(executor, chunk_standardized, path, ranges, max_pending,
+                                     mean, scale, holdout, seed):
+            # partial_fit needs at least n_components rows; carry tiny blocks into the next one
+            # (a final remainder of fewer than n_components rows is left out)
+            if carry is not None:
+                block = np.vstack([carry, block])
+                carry = None
+            if len(block) < n_components:
+                carry = block
+                continue
+            pca.partial_fit(block)
+        pca.feature_names_in_ = np.array(MODEL_FEATURES, dtype=object)
+        pca.n_features_in_ = len(MODEL_FEATURES)
+        log(f"Pass 2: IncrementalPCA explained variance {np.round(pca.explained_variance_ratio_, 3).tolist()} "
+            f"({time.perf_counter() - started:.1f}s)")
+
+        # Pass 3: clusters in PCA space
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, batch_size=min(chunksize, 4096),
+                                 n_init=3)
+        for _ in range(epochs):
+            for block in parallel_ranges(executor, chunk_projected, path, ranges, max_pending,
+                                         mean, scale, pca.mean_.copy(), pca.components_.copy(), holdout, seed):
+                if len(block) >= n_clusters:
+                    kmeans.partial_fit(block)
+        kmeans.feature_names_in_ = np.array([f'PC{i + 1}' for i in range(n_components)], dtype=object)
+        log(f"Pass 3: MiniBatchKMeans, {n_clusters} clusters ({time.perf_counter() - started:.1f}s)")
+
+        # Pass 4: name clusters by the risk of their members, and check against the held-out rows
+        score_sums, cluster_counts = np.zeros(n_clusters), np.zeros(n_clusters, dtype=np.int64)
+        confusion = np.zeros((n_clusters, len(RISK_LABELS)), dtype=np.int64)
+        for chunk_sums, chunk_counts, chunk_confusion in parallel_ranges(
+                executor, chunk_calibration, path, ranges, max_pending, mean, scale,
+                pca.mean_.copy(), pca.components_.copy(), kmeans.cluster_centers_.copy(), holdout, seed):
+            score_sums += chunk_sums
+            cluster_counts += chunk_counts
+            confusion += chunk_confusion
+        # An empty cluster ranks as highest risk rather than dividing by zero
+        mean_scores = np.where(cluster_counts > 0, score_sums / np.maximum(cluster_counts, 1), np.inf)
+        labels = cluster_labels(mean_scores)
+        report = agreement_report(confusion, labels)
+        for cluster, label in enumerate(labels):
+            log(f"  cluster {cluster}: mean risk score {mean_scores[cluster]:.2f} -> {label}")
+        if report['rows']:
+            log(f"Pass 4: held-out agreement with rule-based labels {report['agreement']:.1%} "
+                f"over {report['rows']:,} rows ({time.perf_counter() - started:.1f}s)")
+
+    fold_standardization(pca, mean, scale)
+    encoder = build_encoder(vocab)
+    feature_columns = DUMMY_NUMERIC_COLUMNS + [f'{column}_{value}' for column in CATEGORICAL_COLUMNS
+                                               for value in vocab[column]]
+    # Raises ValueError if the encoder and column list disagree, before anything is written
+    FeaturePipeline(feature_columns, encoder)
+    return {
+        'pca_model.pkl': pca,
+        'kmeans_model.pkl': kmeans,
+        'encoder.pkl': encoder,
+        'feature_columns.pkl': feature_columns,
+        'risk_labels.pkl': labels
+    }, report
+
+
+def validate(engine, path, chunksize=50000, holdout=0.0, seed=42):
+    """Score a CSV with a RiskEngine and compare against rule-based labels.
+
+    With holdout > 0 only the rows train() held out (same fraction and seed)
+    are scored; otherwise every row is.
+    """
+    n_labels = len(RISK_LABELS)
+    confusion = np.zeros((n_labels, n_labels), dtype=np.int64)  # rule label x model label
+    for chunk in read_chunks(path, chunksize):
+        if holdout > 0:
+            _, chunk = split_chunk(chunk, holdout, seed)
+        chunk = chunk.assign(**{column: pd.to_numeric(chunk[column], errors='coerce') for column in MODEL_FEATURES})
+        chunk = chunk.dropna(subset=MODEL_FEATURES)
+        if chunk.empty:
+            continue
+        predicted = engine.predict_many(chunk['Age'].to_numpy(), chunk['Billing Amount'].to_numpy(),
+                                        chunk['Room Number'].to_numpy())
+        expected = risk_levels(risk_scores(chunk['Age'].to_numpy(), chunk['Billing Amount'].to_numpy(),
+                                           chunk['Medical Condition'].to_numpy(),
+                                           chunk['Admission Type'].to_numpy()))
+        categories = list(RISK_LABELS)
+        np.add.at(confusion, (pd.Categorical(expected, categories=categories).codes,
+                              pd.Categorical(predicted, categories=categories).codes), 1)
+    total = int(confusion.sum())
+    return {
+        'rows': total,
+        'agreement': int(np.trace(confusion)) / total if total else None,
+        'confusion': {rule_label: {label: int(confusion[i, j]) for j, label in enumerate(RISK_LABELS)}
+                      for i, rule_label in enumerate(RISK_LABELS)}
+    }
+
+
+def print_report(report):
+    if not report['rows']:
+        print("No rows to validate")
+        return
+    print(f"Agreement with rule-based labels: {report['agreement']:.1%} over {report['rows']:,} rows")
+    print(f"{'rule | model':<14}" + ''.join(f'{label:>14}' for label in RISK_LABELS))
+    for rule_label, row in report['confusion'].items():
+        print(f'{rule_label:<14}' + ''.join(f'{row[label]:>14,}' for label in RISK_LABELS))
+
+
+def save_artifacts(artifacts, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for name, artifact in artifacts.items():
+        joblib.dump(artifact, os.path.join(output_dir, name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the PCA/KMeans risk model out of core")
+    parser.add_argument('--data', default='healthcare_dataset.csv', help='Training CSV')
+    parser.add_argument('--output', default='trained', help='Directory for the .pkl artifacts')
+    parser.add_argument('--chunksize', type=int, default=50000, help='Rows per chunk')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--components', type=int, default=2)
+    parser.add_argument('--clusters', type=int, default=3)
+    parser.add_argument('--epochs', type=int, default=1, help='MiniBatchKMeans passes over the data')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--holdout', type=float, default=0.1,
+                        help='Fraction of rows kept out of training for validation')
+    parser.add_argument('--publish', action='store_true', help='Publish the result into the model registry')
+    parser.add_argument('--version', help='Registry version name (default: timestamp)')
+    parser.add_argument('--activate', action='store_true', help='Serve the published version immediately')
+    parser.add_argument('--models-dir', help='Model registry directory (default: model_dir from the config)')
+    args = parser.parse_args(argv)
+
+    artifacts, report = train(args.data, args.chunksize, args.workers, args.components, args.clusters,
+                              args.epochs, args.seed, args.holdout)
+    save_artifacts(artifacts, args.output)
+    print(f"✓ Artifacts written to {args.output}/")
+    print_report(report)
+
+    if args.publish:
+        from config import get_config
+        from model_registry import ModelRegistry
+        manifest = ModelRegistry(args.models_dir or get_config().model_dir).publish(args.output, args.version, activate=args.activate)
+        print(f"✓ Published model version {manifest['version']}{' (active)' if args.activate else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""
+Write-behind persistence for single predictions
+/predict hands its row to PredictionWriter and returns; a background thread
+commits queued rows in grouped executemany transactions. Every row is first
+appended to a journal file, and each commit records the last journal
+sequence number it covers in the same transaction. A crash therefore loses
+nothing: on the next start, journal entries past the checkpoint are replayed.
+If the in-memory queue fills, rows are only journaled ("spilled") and the
+writer reads them back from the file once it has caught up.
+
+Each process journals to <journal>.<pid> and holds an exclusive lock on it
+while it runs. At start-up a writer replays only journals whose lock is free,
+i.e. whose owner has exited, so a worker still draining during a reload is
+never replayed behind its back.
+"""
+
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: serve.py runs a single process, so there is nobody to race
+    fcntl = None
+
+from metrics import Counter, Histogram
+
+WRITE_BEHIND_ROWS = Counter('hrp_write_behind_rows_total', 'Predictions handled by the write-behind writer',
+                            ['outcome'])
+WRITE_BEHIND_ERRORS = Counter('hrp_write_behind_errors_total', 'Failed write-behind commits (retried)')
+WRITE_BEHIND_BATCH = Histogram('hrp_write_behind_batch_rows', 'Rows per write-behind commit',
+                               buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+
+# Truncate the journal once everything in it is committed and it has grown past this
+JOURNAL_TRUNCATE_BYTES = 1 << 20
+
+
+def _try_lock(f):
+    """Take an exclusive lock on an open journal; False if another process holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _utc_timestamp():
+    # Same format as SQLite's CURRENT_TIMESTAMP, captured when the prediction was made
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class PredictionWriter:
+    """Bounded queue plus background thread persisting predictions in batches.
+
+    flush_interval: longest a queued row waits for companions before commit
+    max_batch:      most rows per transaction
+    max_queue:      rows held in memory before new rows spill to the journal only
+    fsync:          fsync the journal on every row (survives power loss, not just crashes)
+
+    journal_base names the journal; this process writes <journal_base>.<pid>.
+    """
+
+    def __init__(self, db, journal_base, max_queue=10000, max_batch=500, flush_interval=0.05,
+                 fsync=False, retry_delay=1.0):
+        self.db = db
+        self.journal_base = os.path.abspath(journal_base)
+        self.journal_path = f'{self.journal_base}.{os.getpid()}'
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.retry_delay = retry_delay
+
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._committed_cond = threading.Condition()
+        self._stop = threading.Event()
+        self._closed = False
+        self._spilling = False
+
+        self._journal = open(self.journal_path, 'ab')
+        if not _try_lock(self._journal):
+            self._journal.close()
+            raise RuntimeError(f'Journal {self.journal_path} is in use by another writer')
+        # A file under our own name is left over from an earlier process with the same pid
+        with open(self.journal_path, 'rb') as f:
+            self._seq = self._committed = self._replay(self.journal_path, f)
+        os.truncate(self.journal_path, 0)
+        self._committed_offset = 0
+        self._recover_orphans()
+
+        self._thread = threading.Thread(target=self._run, name='prediction-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _read_entries(self, f, limit=None):
+        """Parse complete journal lines from f's position; returns (entries, end offset)"""
+        entries = []
+        offset = f.tell()
+        while limit is None or len(entries) < limit:
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                # End of file, or a line still being written / torn by a crash
+                break
+            try:
+                seq, row = json.loads(line)
+            except ValueError:
+                break
+            offset += len(line)
+            entries.append((seq, offset, tuple(row)))
+        return entries, offset
+
+    def _replay(self, path, f):
+        """Commit entries of journal `path` past its checkpoint; returns the last sequence number seen"""
+        committed = last = self.db.journal_checkpoint(path)
+        while True:
+            entries, _ = self._read_entries(f, self.max_batch)
+            if not entries:
+                break
+            last = max(last, entries[-1][0])
+            pending = [entry for entry in entries if entry[0] > committed]
+            if pending:
+                self.db.commit_journal_batch(path, [row for _, _, row in pending], pending[-1][0])
+                committed = pending[-1][0]
+                WRITE_BEHIND_ROWS.labels('replayed').inc(len(pending))
+        return last
+
+    def _recover_orphans(self):
+        """Replay and remove journals left behind by processes that have exited"""
+        directory, name = os.path.split(self.journal_base)
+        # The base file and <base>.<n> files from older layouts are recovered as well
+        pattern = re.compile(re.escape(name) + r'(\.\d+)*')
+        for entry in sorted(os.listdir(directory)):
+            path = os.path.join(directory, entry)
+            if path == self.journal_path or not pattern.fullmatch(entry):
+                continue
+            try:
+                f = open(path, 'r+b')
+            except FileNotFoundError:
+                continue  # recovered and removed by another worker meanwhile
+            with f:
+                if not _try_lock(f):
+                    continue  # its owner is still running (e.g. draining after a reload)
+                self._replay(path, f)
+                # Empty before unlinking, so a process that opened it meanwhile finds nothing
+                f.truncate(0)
+                os.unlink(path)
+                self.db.delete_journal_checkpoint(path)
+
+    def submit(self, row):
+        """Journal a PREDICTION_COLUMNS + created_at row and queue it for commit"""
+        line_row = list(row)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('PredictionWriter is closed')
+            self._seq += 1
+            seq = self._seq
+            self._journal.write(json.dumps([seq, line_row], separators=(',', ':')).encode() + b'\n')
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            end = self._journal.tell()
+            if not self._spilling:
+                try:
+                    self._queue.put_nowait((seq, end, tuple(row)))
+                    WRITE_BEHIND_ROWS.labels('queued').inc()
+                    return seq
+                except queue.Full:
+                    # From here on rows stay in the journal until the writer catches up
+                    self._spilling = True
+            WRITE_BEHIND_ROWS.labels('spilled').inc()
+            return seq
+
+    def save_prediction(self, user_id, patient_data, risk_level, model_version=None):
+        """Drop-in for Database.save_prediction that returns before the row is committed"""
+        self.submit(self.db.prediction_row(user_id, patient_data, risk_level, model_version) + (_utc_timestamp(),))
+        return True
+
+    def _take(self):
+        """Up to max_batch queued entries, waiting at most flush_interval after the first"""
+        try:
+            batch = [self._queue.get(timeout=min(self.flush_interval, 0.1) or 0.01)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stop.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, entries):
+        """Commit entries, retrying until it succeeds (or we are shutting down)"""
+        last_seq, end = entries[-1][0], entries[-1][1]
+        rows = [row for _, _, row in entries]
+        attempts = 0
+        while True:
+            try:
+                self.db.commit_journal_batch(self.journal_path, rows, last_seq)
+                break
+            except Exception as e:
+                attempts += 1
+                WRITE_BEHIND_ERRORS.inc()
+                print(f"Error committing {len(rows)} journaled predictions (attempt {attempts}): {e}")
+                if self._stop.is_set() and attempts >= 3:
+                    # Rows remain in the journal and are replayed on the next start
+                    return False
+                time.sleep(self.retry_delay)
+        WRITE_BEHIND_BATCH.observe(len(rows))
+        WRITE_BEHIND_ROWS.labels('written').inc(len(rows))
+        with self._committed_cond:
+            self._committed = last_seq
+            self._committed_offset = end
+            self._committed_cond.notify_all()
+        return True
+
+    def _drain_journal(self):
+        """Commit spilled rows straight from the journal, then resume queueing"""
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._committed_offset)
+            while True:
+                entries, _ = self._read_entries(f, self.max_batch)
+                if entries:
+                    if not self._commit(entries):
+                        return False
+                    continue
+                with self._lock:
+                    if self._committed >= self._seq:
+                        self._spilling = False
+                        return True
+                time.sleep(0.01)
+
+    def _maybe_truncate(self):
+        with self._lock:
+            if (self._committed >= self._seq and self._queue.empty()
+                    and self._journal.tell() >= JOURNAL_TRUNCATE_BYTES):
+                self._journal.truncate(0)
+                self._journal.seek(0)
+                self._committed_offset = 0
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch:
+                if not self._commit(batch):
+                    return
+            elif self._spilling:
+                if not self._drain_journal():
+                    return
+            elif self._stop.is_set():
+                return
+            else:
+                self._maybe_truncate()
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is committed; returns False on timeout"""
+        target = self._seq
+        with self._committed_cond:
+            return self._committed_cond.wait_for(lambda: self._committed >= target, timeout)
+
+    def close(self, timeout=30.0):
+        """Stop accepting rows, commit what is pending and release the journal"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        self._thread.join(timeout)
+        with self._lock:
+            done = self._committed >= self._seq and not self._thread.is_alive()
+            if done:
+                self._journal.truncate(0)
+                os.unlink(self.journal_path)
+            # Closing releases the lock; anything left is replayed by the next writer to start
+            self._journal.close()
+        if done:
+            self.db.delete_journal_checkpoint(self.journal_path)
+        atexit.unregister(self.close)